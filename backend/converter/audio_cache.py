@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import unicodedata
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AudioSegmentCache:
+    """
+    Content-addressed store of synthesized audio segments on disk.
+    Segments are keyed by a hash of the normalized chunk text, the engine voice
+    and the language, so identical text is only synthesized once across all
+    documents. When the cache grows past TTS_CACHE_MAX_BYTES the least recently
+    used segments are evicted.
+    """
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = root or settings.TTS_CACHE_DIR
+        self.max_bytes = settings.TTS_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    @staticmethod
+    def normalize(text):
+        """Collapse whitespace and unicode variants that do not change the spoken result"""
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+
+    def make_key(self, text, voice, lang):
+        payload = '\0'.join([self.normalize(text), voice, lang])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], f"{key}.mp3")
+
+    def get(self, key):
+        """Return the cached segment for key, or None"""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Touch the segment so eviction sees it as recently used
+        os.utime(path)
+        return data
+
+    def put(self, key, data):
+        """Store a segment; the write is atomic so readers never see partial files"""
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def evict(self, protected=()):
+        """
+        Remove least recently used segments until the cache is below 90% of
+        max_bytes. Segments whose key is in protected are kept whatever their
+        age. Returns the number of bytes freed.
+        """
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if not filename.endswith('.mp3'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return 0
+
+        target = int(self.max_bytes * 0.9)
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= target:
+                break
+            if os.path.basename(path)[:-len('.mp3')] in protected:
+                continue
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+
+        logger.info(f"Evicted {freed} bytes from the audio segment cache")
+        return freed
@@ -0,0 +1,24 @@
+import uuid
+
+from django.core.cache import cache
+
+
+def version_key(user_id):
+    return f"document-list-version:{user_id}"
+
+
+def get_cache_key(user_id, url):
+    """
+    Cache key for a page of a user's document list. Keys embed the user's
+    current list version, so invalidation never has to find old entries.
+    """
+    version = cache.get(version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(version_key(user_id), version, None)
+    return f"document-list:{user_id}:{version}:{url}"
+
+
+def invalidate(user_id):
+    """Drop every cached page of a user's document list"""
+    cache.set(version_key(user_id), uuid.uuid4().hex, None)
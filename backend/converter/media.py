@@ -0,0 +1,163 @@
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework.exceptions import NotAcceptable
+from rest_framework.negotiation import DefaultContentNegotiation
+
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def parse_range(range_header, size):
+    """
+    Parse a single-range Range header into an inclusive (start, end) pair.
+    Returns None when the header is absent or not something we serve partially
+    (the full file is sent instead), and raises ValueError when it cannot be
+    satisfied.
+    """
+    match = RANGE_HEADER.match(range_header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, end
+
+
+class MediaContentNegotiation(DefaultContentNegotiation):
+    """
+    Content negotiation for actions that serve files. Clients ask for the file's
+    type (image/webp, audio/mpeg, ...), which no API renderer produces; rather
+    than answering 406, the first renderer is used for any JSON status or error
+    body, and the file itself is served as is.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        try:
+            return super().select_renderer(request, renderers, format_suffix)
+        except NotAcceptable:
+            return renderers[0], renderers[0].media_type
+
+
+class FileRange:
+    """
+    A file limited to `length` bytes from `start`.
+    It keeps fileno(), so a WSGI server's file_wrapper (gunicorn, uWSGI) can
+    still send the range with os.sendfile instead of copying it through Python.
+    """
+
+    def __init__(self, path, start, length):
+        self._file = open(path, 'rb')
+        self._file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def tell(self):
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+def file_etag(stat):
+    """Strong ETag from a file's size and modification time"""
+    return f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def sendfile_response(path, content_type):
+    """
+    Hand the transfer to the web server when MEDIA_SENDFILE_BACKEND is set.
+    Returns None when files must be served by Django itself.
+    """
+    backend = settings.MEDIA_SENDFILE_BACKEND
+    if backend == 'x-accel-redirect':
+        # nginx: an internal location maps MEDIA_SENDFILE_URL onto MEDIA_ROOT
+        relative_path = os.path.relpath(path, settings.MEDIA_ROOT)
+        if relative_path.startswith('..'):
+            return None
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.MEDIA_SENDFILE_URL + quote(relative_path.replace(os.sep, '/'))
+        return response
+    if backend == 'x-sendfile':
+        # Apache mod_xsendfile / lighttpd
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(path)
+        return response
+    return None
+
+
+def serve_file(request, path, content_type):
+    """
+    Serve a file from disk with ETag/Last-Modified validation and single-range
+    HTTP Range support. The body goes out through X-Accel-Redirect/X-Sendfile
+    when configured, otherwise through the WSGI file_wrapper (os.sendfile).
+    """
+    stat = os.stat(path)
+    etag = file_etag(stat)
+
+    # If-None-Match / If-Modified-Since: answer 304 without touching the file
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    response = sendfile_response(path, content_type)
+    if response is None:
+        response = build_file_response(request, path, content_type, stat.st_size, etag)
+        if response.status_code == 416:
+            return response
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def build_file_response(request, path, content_type, size, etag):
+    """Full or partial (206) response streamed from the file"""
+    range_header = request.META.get('HTTP_RANGE')
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if range_header and if_range and if_range != etag:
+        # The client's copy is stale: send the whole current file
+        if_range_date = parse_http_date_safe(if_range)
+        if if_range_date is None or if_range_date < int(os.path.getmtime(path)):
+            range_header = None
+
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f"bytes */{size}"
+        return response
+
+    if byte_range is None:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(FileRange(path, start, length), status=206, content_type=content_type)
+    response['Content-Range'] = f"bytes {start}-{end}/{size}"
+    response['Content-Length'] = str(length)
+    return response
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.23 on 2026-10-18 02:57
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='pdfdocument',
+            options={'ordering': ['-uploaded_at']},
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='processing_status',
+            field=models.CharField(choices=[('uploaded', 'Uploaded'), ('generating_thumbnails', 'Generating Thumbnails'), ('ready', 'Ready'), ('error', 'Error')], default='uploaded', max_length=25),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='thumbnails_done',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='thumbnails_generated',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='total_pages',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='processeddocument',
+            name='audio_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='processeddocument',
+            name='edited_text',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='pdfdocument',
+            name='original_file',
+            field=models.FileField(upload_to='pdfs/', validators=[django.core.validators.FileExtensionValidator(allowed_extensions=['pdf'])]),
+        ),
+    ]
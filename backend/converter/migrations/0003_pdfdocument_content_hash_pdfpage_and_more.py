@@ -0,0 +1,37 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0002_alter_pdfdocument_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.CreateModel(
+            name='PDFPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('page_number', models.IntegerField()),
+                ('width', models.FloatField()),
+                ('height', models.FloatField()),
+                ('text', models.TextField(blank=True)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='converter.pdfdocument')),
+            ],
+            options={
+                'ordering': ['page_number'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='pdfpage',
+            constraint=models.UniqueConstraint(fields=('document', 'page_number'), name='unique_document_page'),
+        ),
+    ]
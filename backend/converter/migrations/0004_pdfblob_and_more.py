@@ -0,0 +1,112 @@
+# Generated by Django 4.2.23 on 2026-10-18 09:12
+
+import os
+
+import converter.models
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def move_pages_to_blobs(apps, schema_editor):
+    """Create a blob per distinct content hash and hand it the ingested pages"""
+    PDFBlob = apps.get_model("converter", "PDFBlob")
+    PDFDocument = apps.get_model("converter", "PDFDocument")
+    PDFPage = apps.get_model("converter", "PDFPage")
+
+    for document in PDFDocument.objects.all():
+        document.original_filename = os.path.basename(document.original_file.name)
+        if document.content_hash:
+            blob, created = PDFBlob.objects.get_or_create(
+                content_hash=document.content_hash,
+                defaults={"file": document.original_file.name},
+            )
+            document.blob = blob
+            if created:
+                PDFPage.objects.filter(document=document).update(blob=blob)
+                blob.total_pages = PDFPage.objects.filter(blob=blob).count()
+                blob.ingested = blob.total_pages > 0
+                blob.save()
+        document.save()
+
+    # Pages of duplicates, and of documents without a hash, are ingested again on demand
+    PDFPage.objects.filter(blob__isnull=True).delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("converter", "0003_pdfdocument_content_hash_pdfpage_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PDFBlob",
+            fields=[
+                (
+                    "content_hash",
+                    models.CharField(max_length=64, primary_key=True, serialize=False),
+                ),
+                (
+                    "file",
+                    models.FileField(upload_to=converter.models.blob_upload_path),
+                ),
+                ("size", models.BigIntegerField(default=0)),
+                ("total_pages", models.IntegerField(default=0)),
+                ("ingested", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="pdfdocument",
+            name="original_filename",
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name="pdfdocument",
+            name="blob",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="documents",
+                to="converter.pdfblob",
+            ),
+        ),
+        migrations.AddField(
+            model_name="pdfpage",
+            name="blob",
+            field=models.ForeignKey(
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pages",
+                to="converter.pdfblob",
+            ),
+        ),
+        migrations.RunPython(move_pages_to_blobs, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name="pdfpage",
+            name="unique_document_page",
+        ),
+        migrations.RemoveField(
+            model_name="pdfpage",
+            name="document",
+        ),
+        migrations.AlterField(
+            model_name="pdfpage",
+            name="blob",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="pages",
+                to="converter.pdfblob",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="pdfpage",
+            constraint=models.UniqueConstraint(
+                fields=("blob", "page_number"), name="unique_blob_page"
+            ),
+        ),
+        migrations.RemoveField(
+            model_name="pdfdocument",
+            name="content_hash",
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0004_pdfblob_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddocument',
+            name='audio_progress',
+            field=models.IntegerField(default=0),
+        ),
+    ]
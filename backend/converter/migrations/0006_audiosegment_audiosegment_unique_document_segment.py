@@ -0,0 +1,33 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0005_processeddocument_audio_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioSegment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.IntegerField()),
+                ('cache_key', models.CharField(blank=True, max_length=64)),
+                ('duration', models.FloatField(default=0)),
+                ('size', models.IntegerField(default=0)),
+                ('completed', models.BooleanField(default=False)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='converter.processeddocument')),
+            ],
+            options={
+                'ordering': ['index'],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='audiosegment',
+            constraint=models.UniqueConstraint(fields=('document', 'index'), name='unique_document_segment'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0007_pdfdocument_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='pdfdocument',
+            index=models.Index(fields=['user', '-uploaded_at', '-id'], name='pdfdocument_user_uploaded'),
+        ),
+    ]
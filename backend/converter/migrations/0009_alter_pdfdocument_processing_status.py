@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0008_pdfdocument_pdfdocument_user_uploaded'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pdfdocument',
+            name='processing_status',
+            field=models.CharField(choices=[('uploaded', 'Uploaded'), ('generating_thumbnails', 'Generating Thumbnails'), ('ready', 'Ready'), ('error', 'Error')], default='uploaded', max_length=25),
+        ),
+    ]
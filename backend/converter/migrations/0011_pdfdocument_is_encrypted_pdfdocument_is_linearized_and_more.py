@@ -0,0 +1,28 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0010_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='is_encrypted',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='is_linearized',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='text_layer',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
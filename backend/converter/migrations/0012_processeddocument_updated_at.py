@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0011_pdfdocument_is_encrypted_pdfdocument_is_linearized_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processeddocument',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
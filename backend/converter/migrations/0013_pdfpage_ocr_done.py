@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0012_processeddocument_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfpage',
+            name='ocr_done',
+            field=models.BooleanField(default=False),
+        ),
+    ]
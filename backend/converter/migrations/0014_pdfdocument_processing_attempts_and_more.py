@@ -0,0 +1,23 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0013_pdfpage_ocr_done'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='processing_attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='processeddocument',
+            name='audio_attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
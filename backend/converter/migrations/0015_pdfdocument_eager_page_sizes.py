@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0014_pdfdocument_processing_attempts_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='eager_page_sizes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0015_pdfdocument_eager_page_sizes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='processeddocument',
+            name='audio_status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('queued', 'Queued'), ('processing', 'Processing'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.23 on 2026-10-18 03:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('converter', '0016_alter_processeddocument_audio_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pdfdocument',
+            name='ocr_attempts',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -1,8 +1,47 @@
+import os
 import uuid
-from django.db import models
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
 from django.contrib.auth.models import User
 from django.core.validators import FileExtensionValidator
 
+from .pagesets import PageSet
+from .utils import join_page_texts
+
+def blob_upload_path(instance, filename):
+    """Store blobs by content hash: blobs/ab/abcdef....pdf"""
+    return f"blobs/{instance.content_hash[:2]}/{instance.content_hash}.pdf"
+
+class PDFBlob(models.Model):
+    """A unique PDF file, shared by every upload of the same content"""
+    content_hash = models.CharField(max_length=64, primary_key=True)  # SHA-256 of the file
+    file = models.FileField(upload_to=blob_upload_path)
+    size = models.BigIntegerField(default=0)
+    total_pages = models.IntegerField(default=0)
+    ingested = models.BooleanField(default=False)  # Page sizes and text stored in PDFPage
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"PDF Blob {self.content_hash}"
+    
+    @classmethod
+    def store(cls, upload, content_hash):
+        """Return the blob for this content, saving the upload only if it is new"""
+        blob = cls.objects.filter(pk=content_hash).first()
+        if blob:
+            return blob, False
+        
+        blob = cls(content_hash=content_hash, size=upload.size)
+        blob.file.save(upload.name, upload, save=False)
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # Another request stored the same content first
+            blob.file.delete(save=False)
+            return cls.objects.get(pk=content_hash), False
+        return blob, True
+
 class PDFDocument(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -10,12 +49,23 @@ class PDFDocument(models.Model):
         upload_to='pdfs/',
         validators=[FileExtensionValidator(allowed_extensions=['pdf'])]
     )
+    original_filename = models.CharField(max_length=255, blank=True)  # Name the user uploaded
+    blob = models.ForeignKey(PDFBlob, on_delete=models.PROTECT, null=True, blank=True, related_name='documents')
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Validator for detail/status ETags; set it in .update() calls
     total_pages = models.IntegerField(default=0)
     pages_deleted = models.JSONField(default=list)  # Store deleted page numbers as list of integers
     thumbnails_generated = models.BooleanField(default=False)
+    thumbnails_done = models.IntegerField(default=0)  # Pages rendered so far by the background task
+    # Upload-time triage (see utils.triage_pdf)
+    is_encrypted = models.BooleanField(default=False)  # Encrypted, but readable without a password
+    is_linearized = models.BooleanField(default=False)
+    text_layer = models.FloatField(null=True, blank=True)  # Estimated share of pages with text; None if not triaged
+    eager_page_sizes = models.JSONField(default=list, blank=True)  # [width, height] of the first screen's pages
+    processing_attempts = models.IntegerField(default=0)  # Thumbnail task runs, including redeliveries after a crash
+    ocr_attempts = models.IntegerField(default=0)  # OCR task runs; the sweeper stops resuming OCR after a few
     processing_status = models.CharField(
-        max_length=20,
+        max_length=25,
         choices=[
             ('uploaded', 'Uploaded'),
             ('generating_thumbnails', 'Generating Thumbnails'),
@@ -27,28 +77,183 @@ class PDFDocument(models.Model):
     
     class Meta:
         ordering = ['-uploaded_at']
+        indexes = [
+            # Document library listing: a user's documents by upload time (see DocumentCursorPagination)
+            models.Index(fields=['user', '-uploaded_at', '-id'], name='pdfdocument_user_uploaded'),
+        ]
     
     def __str__(self):
         return f"PDF Document {self.id} - {self.original_file.name}"
     
+    @classmethod
+    def create_from_upload(cls, user, upload, content_hash, filename, triage=None):
+        """
+        Create a document for an uploaded file, sharing the blob of identical content.
+        triage holds the fields found by utils.triage_pdf, if it ran.
+        """
+        blob, created = PDFBlob.store(upload, content_hash)
+        return cls.objects.create(
+            user=user,
+            original_file=blob.file.name,
+            original_filename=os.path.basename(filename),
+            blob=blob,
+            **(triage or {})
+        )
+    
     @property
     def filename(self):
+        if self.original_filename:
+            return self.original_filename
         return self.original_file.name.split('/')[-1] if self.original_file else None
     
+    @property
+    def content_hash(self):
+        return self.blob_id
+    
+    @property
+    def pages(self):
+        """Pages stored at ingestion, shared by every upload of the same content"""
+        return PDFPage.objects.filter(blob_id=self.blob_id)
+    
+    @property
+    def ingested(self):
+        """Whether every page of the content is in the page store, not just a resumable part"""
+        return bool(self.blob_id) and self.blob.ingested
+    
+    @property
+    def thumbnail_key(self):
+        """Thumbnails are cached per content hash; older uploads use their own id"""
+        return self.blob_id or self.id
+    
+    @property
+    def deleted_page_set(self):
+        """
+        Deleted pages as a PageSet, for constant-time membership tests.
+        Stored values that are not pages of this document are ignored.
+        """
+        return PageSet(
+            page for page in self.pages_deleted or []
+            if isinstance(page, int) and 1 <= page <= self.total_pages
+        )
+    
+    @property
+    def active_page_set(self):
+        """Pages that are not deleted as a PageSet"""
+        return self.deleted_page_set.complement(self.total_pages)
+    
     @property
     def active_pages(self):
         """Return list of page numbers that are not deleted"""
-        if not self.pages_deleted:
-            return list(range(1, self.total_pages + 1))
-        return [page for page in range(1, self.total_pages + 1) if page not in self.pages_deleted]
+        return list(self.active_page_set)
+    
+    @property
+    def pages_deleted_ranges(self):
+        """Deleted pages as [first, last] ranges"""
+        return self.deleted_page_set.ranges()
+    
+    @property
+    def active_page_ranges(self):
+        """Pages that are not deleted as [first, last] ranges"""
+        return self.active_page_set.ranges()
     
     @property
     def deleted_pages_count(self):
-        return len(self.pages_deleted) if self.pages_deleted else 0
+        return len(self.deleted_page_set)
     
     @property
     def active_pages_count(self):
         return self.total_pages - self.deleted_pages_count
+    
+    @property
+    def thumbnail_target(self):
+        """Number of pages rendered up front; the rest are rendered on request"""
+        return min(self.total_pages, settings.THUMBNAIL_EAGER_PAGES)
+    
+    @property
+    def thumbnail_progress(self):
+        """Return up-front thumbnail rendering progress as a percentage"""
+        if not self.thumbnail_target:
+            return 0
+        return min(100, int(self.thumbnails_done * 100 / self.thumbnail_target))
+
+    def get_page_sizes(self, first_page=1, last_page=None):
+        """
+        Return stored page sizes in points, keyed by page number. Before ingestion,
+        the first-screen sizes recorded at triage are used if they cover the range.
+        """
+        pages = self.pages.filter(page_number__gte=first_page)
+        if last_page:
+            pages = pages.filter(page_number__lte=last_page)
+        sizes = {
+            page_number: (width, height)
+            for page_number, width, height in pages.values_list('page_number', 'width', 'height')
+        }
+        last_page = min(last_page or self.total_pages, self.total_pages)
+        if not sizes and self.total_pages and last_page <= len(self.eager_page_sizes):
+            sizes = {
+                page_number: tuple(self.eager_page_sizes[page_number - 1])
+                for page_number in range(first_page, last_page + 1)
+            }
+        return sizes
+
+    def iter_active_text(self):
+        """Yield (page_number, text) for non-deleted pages from the text stored at ingestion"""
+        # Deleted pages are skipped here rather than in SQL, so the query does not grow with the selection
+        deleted = self.deleted_page_set
+        pages = self.pages.exclude(text='').values_list('page_number', 'text').iterator(chunk_size=100)
+        return ((page_number, text) for page_number, text in pages if page_number not in deleted)
+    
+    def get_active_text(self):
+        """Assemble the text of non-deleted pages from the per-page text stored at ingestion"""
+        return join_page_texts(self.iter_active_text())
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. Clients append chunks at `offset` until
+    `length` bytes have arrived, then finalize it into a PDFDocument.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField()  # Declared size of the whole file in bytes
+    offset = models.BigIntegerField(default=0)  # Bytes received so far
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('uploading', 'Uploading'),
+            ('completed', 'Completed')
+        ],
+        default='uploading'
+    )
+    document = models.ForeignKey(PDFDocument, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Upload Session {self.id} - {self.filename} ({self.offset}/{self.length})"
+    
+    @property
+    def path(self):
+        """Where the received bytes are assembled"""
+        return os.path.join(settings.UPLOAD_SESSION_DIR, f"{self.id}.part")
+
+class PDFPage(models.Model):
+    """Per-page data recorded once when a PDF's content is ingested"""
+    blob = models.ForeignKey(PDFBlob, on_delete=models.CASCADE, related_name='pages')
+    page_number = models.IntegerField()  # 1-based
+    width = models.FloatField()  # Points, after applying page rotation
+    height = models.FloatField()
+    text = models.TextField(blank=True)
+    ocr_done = models.BooleanField(default=False)  # Page had no text layer and was OCRed; text holds the result
+    
+    class Meta:
+        ordering = ['page_number']
+        constraints = [
+            models.UniqueConstraint(fields=['blob', 'page_number'], name='unique_blob_page')
+        ]
+    
+    def __str__(self):
+        return f"Page {self.page_number} of {self.blob_id}"
 
 class ProcessedDocument(models.Model):
     pdf = models.OneToOneField(PDFDocument, on_delete=models.CASCADE)
@@ -59,13 +264,40 @@ class ProcessedDocument(models.Model):
     audio_status = models.CharField(
         max_length=20,
         choices=[
-            ('pending', 'Pending'),
+            ('pending', 'Pending'),  # Not requested yet
+            ('queued', 'Queued'),
             ('processing', 'Processing'),
             ('completed', 'Completed'),
             ('failed', 'Failed')
         ],
         default='pending'
     )
+    audio_progress = models.IntegerField(default=0)  # Percentage of synthesis done
+    updated_at = models.DateTimeField(auto_now=True)  # Last audio progress; the sweeper resumes jobs that stall
+    audio_attempts = models.IntegerField(default=0)  # Audio task runs since audio was last requested
+    
+    def __str__(self):
+        return f"Processed Document for {self.pdf.filename}"
+    
+    def refresh_extracted_text(self):
+        """Rebuild extracted_text from stored page text after the page selection changes"""
+        self.extracted_text = self.pdf.get_active_text()
+        self.save(update_fields=['extracted_text'])
+
+class AudioSegment(models.Model):
+    """One synthesized chunk of a processed document's audio, in playback order"""
+    document = models.ForeignKey(ProcessedDocument, on_delete=models.CASCADE, related_name='segments')
+    index = models.IntegerField()  # 0-based position in the audio
+    cache_key = models.CharField(max_length=64, blank=True)  # Key of the MP3 in the audio segment cache
+    duration = models.FloatField(default=0)  # Seconds
+    size = models.IntegerField(default=0)  # Bytes
+    completed = models.BooleanField(default=False)
+    
+    class Meta:
+        ordering = ['index']
+        constraints = [
+            models.UniqueConstraint(fields=['document', 'index'], name='unique_document_segment')
+        ]
     
     def __str__(self):
-        return f"Processed Document for {self.pdf.filename}"
\ No newline at end of file
+        return f"Segment {self.index} of processed document {self.document_id}"
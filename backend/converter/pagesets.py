@@ -0,0 +1,98 @@
+def range_mask(first_page, last_page):
+    """Bits for pages first_page..last_page inclusive"""
+    if last_page < first_page:
+        return 0
+    return ((1 << (last_page - first_page + 1)) - 1) << first_page
+
+
+class PageSet:
+    """
+    A set of 1-based page numbers kept as the bits of one integer: page N is bit N.
+    Membership is a shift and a mask, counting is a popcount, and set operations
+    work on whole words, so a 2,000-page document fits in 250 bytes and no
+    operation scans a list of pages.
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, pages=(), bits=0):
+        if isinstance(pages, PageSet):
+            bits |= pages.bits
+        else:
+            for page in pages:
+                page = int(page)
+                if page < 1:
+                    raise ValueError(f"Page numbers start at 1, got {page}")
+                bits |= 1 << page
+        self.bits = bits
+
+    @classmethod
+    def parse(cls, spec, max_page=None):
+        """
+        Parse page ranges such as "10-250,3,7-9", or a list of page numbers and
+        range strings. Raises ValueError for malformed items, reversed ranges and
+        pages above max_page.
+        """
+        items = spec.split(',') if isinstance(spec, str) else spec
+        bits = 0
+        for item in items:
+            if isinstance(item, int):
+                first_page = last_page = item
+            else:
+                first, dash, last = str(item).strip().partition('-')
+                first_page = int(first)
+                last_page = int(last) if dash else first_page
+            if first_page < 1 or last_page < first_page:
+                raise ValueError(f"Invalid page range {item!r}")
+            if max_page is not None and last_page > max_page:
+                raise ValueError(f"Page {last_page} does not exist. Document has {max_page} pages.")
+            bits |= range_mask(first_page, last_page)
+        return cls(bits=bits)
+
+    def __contains__(self, page):
+        return page >= 1 and (self.bits >> page) & 1 == 1
+
+    def __len__(self):
+        return self.bits.bit_count()
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def __iter__(self):
+        """Page numbers in ascending order, skipping absent pages in constant time each"""
+        bits = self.bits
+        while bits:
+            lowest = bits & -bits
+            yield lowest.bit_length() - 1
+            bits ^= lowest
+
+    def __eq__(self, other):
+        return isinstance(other, PageSet) and self.bits == other.bits
+
+    def __or__(self, other):
+        return PageSet(bits=self.bits | other.bits)
+
+    def __and__(self, other):
+        return PageSet(bits=self.bits & other.bits)
+
+    def __sub__(self, other):
+        return PageSet(bits=self.bits & ~other.bits)
+
+    def __repr__(self):
+        return f"PageSet({self.ranges()})"
+
+    def ranges(self):
+        """Pages as run-length encoded [first, last] pairs, one per run of set bits"""
+        ranges = []
+        bits = self.bits
+        while bits:
+            first_page = (bits & -bits).bit_length() - 1
+            run = bits >> first_page
+            run_length = (~run & (run + 1)).bit_length() - 1
+            ranges.append([first_page, first_page + run_length - 1])
+            bits &= ~range_mask(first_page, first_page + run_length - 1)
+        return ranges
+
+    def complement(self, total_pages):
+        """Pages of a total_pages document that are not in this set"""
+        return PageSet(bits=range_mask(1, total_pages) & ~self.bits)
@@ -0,0 +1,17 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class ThumbnailPagination(LimitOffsetPagination):
+    """Pages through a document's thumbnail entries with ?offset= and ?limit="""
+    default_limit = settings.THUMBNAIL_LIST_LIMIT
+    max_limit = settings.THUMBNAIL_LIST_MAX_LIMIT
+
+
+class DocumentCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's documents, newest first. Each page is an
+    index range scan on (user, uploaded_at, id), however deep the client goes.
+    """
+    page_size = settings.DOCUMENT_LIST_PAGE_SIZE
+    ordering = ('-uploaded_at', '-id')
@@ -0,0 +1,148 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import PDFDocument, ProcessedDocument
+
+logger = logging.getLogger(__name__)
+
+# Stage queues; run a worker per queue so bulk work never blocks interactive work:
+#   celery -A pdf2audio_core worker -Q thumbnails
+THUMBNAILS = 'thumbnails'  # Ingestion and the first screen of thumbnails (interactive)
+PREFETCH = 'prefetch'  # Thumbnails ahead of the client's scroll position
+AUDIO = 'audio'  # Speech synthesis
+OCR = 'ocr'  # Text recognition for pages without a text layer
+
+# Stages whose job is counted by user_load from the moment it is submitted:
+# its document is 'uploaded' or its audio 'queued' before the job is queued
+SELF_COUNTED_STAGES = {THUMBNAILS, AUDIO}
+
+# Scheduler priorities run from 0 (most urgent) to 9
+MAX_PRIORITY = 9
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def thumbnail_cost(total_pages, text_layer=None):
+    """
+    Estimated work units to ingest a document and render its first screen.
+    text_layer is the triage estimate of the share of pages with text; the rest
+    are scanned pages, which decode a full-page image and cost more to render.
+    """
+    eager_pages = min(total_pages, settings.THUMBNAIL_EAGER_PAGES)
+    scanned_share = 1 - (1 if text_layer is None else text_layer)
+    page_cost = 1 + scanned_share * (settings.SCHEDULER_SCANNED_PAGE_COST - 1)
+    return eager_pages * page_cost + total_pages * settings.SCHEDULER_INGEST_PAGE_COST
+
+
+def prefetch_cost(page_count):
+    return page_count
+
+
+def ocr_cost(page_count):
+    """Estimated work units to OCR pages, relative to rendering one thumbnail"""
+    return page_count * settings.SCHEDULER_OCR_PAGE_COST
+
+def audio_cost(text_length):
+    """Estimated work units to synthesize text, one per TTS chunk"""
+    return math.ceil(text_length / settings.TTS_CHUNK_MAX_CHARS)
+
+
+def user_load(user_id):
+    """
+    Jobs the user already has queued or running, across every stage.
+    Audio counts once requested; 'pending' only means it was never asked for.
+    """
+    documents = PDFDocument.objects.filter(
+        user_id=user_id, processing_status__in=['uploaded', 'generating_thumbnails']
+    ).count()
+    audio = ProcessedDocument.objects.filter(
+        pdf__user_id=user_id, audio_status__in=['queued', 'processing']
+    ).count()
+    return documents + audio
+
+
+def job_priority(cost, load):
+    """
+    Shortest job first: small jobs get urgent priorities on a log scale of cost.
+    Each other job the user already has in flight (load) pushes the new one
+    back a step, so one heavy user cannot starve everyone else.
+    """
+    size_rank = int(math.log2(max(cost, 1)) / 2)
+    return min(size_rank + max(load, 0), MAX_PRIORITY)
+
+
+class CeleryBroker:
+    """Publishes jobs to Celery, one queue per stage"""
+
+    def publish(self, stage, priority, task, args):
+        if settings.CELERY_BROKER_URL.startswith('amqp'):
+            # RabbitMQ treats higher numbers as more urgent; Redis the reverse
+            priority = MAX_PRIORITY - priority
+        task.apply_async(args=args, queue=stage, priority=priority)
+
+
+class InProcessBroker:
+    """
+    Stand-in broker for local runs and tests: jobs wait in per-stage priority
+    heaps until run_pending() executes them in the order a worker would.
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+
+    def publish(self, stage, priority, task, args):
+        with self.lock:
+            heapq.heappush(self.queues.setdefault(stage, []), (priority, next(self.sequence), task, args))
+
+    def pending(self, stage):
+        """(task name, args) of the jobs waiting in a stage, in run order"""
+        with self.lock:
+            return [(task.name, args) for _, _, task, args in sorted(self.queues.get(stage, []))]
+
+    def run_pending(self, stage=None):
+        """
+        Run waiting jobs (of one stage, or all) until the queues are empty,
+        including jobs that running jobs queue on other stages.
+        """
+        while True:
+            with self.lock:
+                stages = [stage] if stage else list(self.queues)
+                waiting = [name for name in stages if self.queues.get(name)]
+                if not waiting:
+                    return
+                _, _, task, args = heapq.heappop(self.queues[waiting[0]])
+            task(*args)
+
+
+class Scheduler:
+    """Prioritizes converter jobs by estimated cost and the submitting user's load"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def submit(self, task, args, stage, user_id, cost):
+        load = user_load(user_id)
+        if stage in SELF_COUNTED_STAGES:
+            load -= 1
+        priority = job_priority(cost, load)
+        self.broker.publish(stage, priority, task, args)
+        logger.info(f"Scheduled {task.name} on {stage} with priority {priority} (cost {cost:.0f})")
+        return priority
+
+
+def get_scheduler():
+    """Return the process-wide scheduler using the SCHEDULER_BROKER class"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(import_string(settings.SCHEDULER_BROKER)())
+        return _scheduler
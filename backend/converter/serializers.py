@@ -1,5 +1,11 @@
+import math
+from django.conf import settings
+from django.urls import reverse
 from rest_framework import serializers
-from .models import PDFDocument, ProcessedDocument
+from .models import PDFDocument, ProcessedDocument, UploadSession
+from .pagesets import PageSet
+from .uploads import hash_upload
+from .utils import PDFTriageError, get_sprite_layout, get_sprite_range, triage_pdf
 
 class PDFDocumentSerializer(serializers.ModelSerializer):
     filename = serializers.ReadOnlyField()
@@ -11,71 +17,246 @@ class PDFDocumentSerializer(serializers.ModelSerializer):
         model = PDFDocument
         fields = [
             'id', 'filename', 'uploaded_at', 'total_pages', 
-            'pages_deleted', 'thumbnails_generated', 'processing_status',
+            'pages_deleted', 'thumbnails_generated', 'thumbnails_done', 'processing_status',
             'active_pages', 'active_pages_count', 'deleted_pages_count'
         ]
-        read_only_fields = ['id', 'uploaded_at', 'total_pages', 'thumbnails_generated', 'processing_status']
+        # Page selection changes go through update_page_selection, which validates them
+        read_only_fields = [
+            'id', 'uploaded_at', 'total_pages', 'pages_deleted', 'thumbnails_generated', 'thumbnails_done',
+            'processing_status'
+        ]
+
+class PDFDocumentListSerializer(serializers.ModelSerializer):
+    """Document library entry: counts only, no per-page arrays"""
+    filename = serializers.ReadOnlyField()
+    active_pages_count = serializers.ReadOnlyField()
+    deleted_pages_count = serializers.ReadOnlyField()
+    
+    class Meta:
+        model = PDFDocument
+        fields = [
+            'id', 'filename', 'uploaded_at', 'updated_at', 'total_pages', 'thumbnails_generated',
+            'processing_status', 'active_pages_count', 'deleted_pages_count'
+        ]
+        read_only_fields = fields
 
 class PDFUploadSerializer(serializers.ModelSerializer):
     class Meta:
         model = PDFDocument
         fields = ['original_file']
     
+    def validate_original_file(self, value):
+        # Reject unreadable and password-protected files before anything is stored
+        try:
+            value.triage = triage_pdf(value.temporary_file_path() if hasattr(value, 'temporary_file_path') else value)
+        except PDFTriageError as e:
+            raise serializers.ValidationError(str(e))
+        return value
+    
     def create(self, validated_data):
-        validated_data['user'] = self.context['request'].user
-        return super().create(validated_data)
+        upload = validated_data['original_file']
+        content_hash = getattr(upload, 'content_hash', None) or hash_upload(upload)
+        
+        # Identical content is stored once and shared between uploads
+        return PDFDocument.create_from_upload(
+            self.context['request'].user, upload, content_hash, upload.name, triage=upload.triage
+        )
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'length', 'offset', 'status', 'document', 'created_at']
+        read_only_fields = ['id', 'offset', 'status', 'document', 'created_at']
+    
+    def validate_filename(self, value):
+        if not value.lower().endswith('.pdf'):
+            raise serializers.ValidationError('Only PDF files can be uploaded.')
+        return value
+    
+    def validate_length(self, value):
+        if not 0 < value <= settings.UPLOAD_MAX_BYTES:
+            raise serializers.ValidationError(f'Uploads must be between 1 and {settings.UPLOAD_MAX_BYTES} bytes.')
+        return value
+
+class PageRangeField(serializers.Field):
+    """Page ranges such as "10-250,3" (or a list of pages and ranges), parsed into a PageSet"""
+    default_error_messages = {
+        'invalid': 'Expected page ranges such as "10-250,3": {error}'
+    }
+    
+    def to_internal_value(self, data):
+        if not isinstance(data, (str, list)):
+            self.fail('invalid', error='not a string or list')
+        try:
+            return PageSet.parse(data, max_page=self.context.get('total_pages'))
+        except (TypeError, ValueError) as e:
+            self.fail('invalid', error=e)
+    
+    def to_representation(self, value):
+        return value.ranges()
 
 class PageSelectionSerializer(serializers.Serializer):
     pages_deleted = serializers.ListField(
         child=serializers.IntegerField(min_value=1),
         allow_empty=True,
-        help_text="List of page numbers to delete (1-based)"
+        required=False,
+        help_text="List of page numbers to delete (1-based); replaces the current selection"
     )
+    delete = PageRangeField(required=False, help_text="Pages to mark deleted, e.g. \"10-250,3\"")
+    restore = PageRangeField(required=False, help_text="Pages to restore, e.g. \"10-250,3\"")
     
     def validate_pages_deleted(self, value):
+        total_pages = self.context.get('total_pages')
+        if value and total_pages is not None and max(value) > total_pages:
+            raise serializers.ValidationError(
+                f'Page {max(value)} does not exist. Document has {total_pages} pages.'
+            )
         # Remove duplicates and sort
-        return sorted(list(set(value)))
+        return list(PageSet(value))
+    
+    def validate(self, attrs):
+        if 'pages_deleted' in attrs and ('delete' in attrs or 'restore' in attrs):
+            raise serializers.ValidationError('Send either pages_deleted or delete/restore, not both.')
+        if not attrs:
+            raise serializers.ValidationError('Send pages_deleted, or delete and/or restore page ranges.')
+        return attrs
+    
+    def apply(self, pages_deleted):
+        """Return the deleted pages after applying this change to the current PageSet"""
+        if 'pages_deleted' in self.validated_data:
+            return PageSet(self.validated_data['pages_deleted'])
+        pages_deleted = pages_deleted - self.validated_data.get('restore', PageSet())
+        return pages_deleted | self.validated_data.get('delete', PageSet())
 
 class ThumbnailSerializer(serializers.Serializer):
     page_number = serializers.IntegerField()
     url = serializers.URLField()
     is_deleted = serializers.BooleanField()
 
-class DocumentDetailSerializer(serializers.ModelSerializer):
+class FieldSelectionMixin:
+    """
+    Sparse fieldsets: ?fields=id,total_pages limits the output to the named fields.
+    Fields listed in Meta.optional_fields are only included when named.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        requested = request.query_params.get('fields') if request else None
+        
+        if requested:
+            keep = {name.strip() for name in requested.split(',')}
+        else:
+            keep = set(self.fields) - set(getattr(self.Meta, 'optional_fields', []))
+        
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+def get_thumbnail_entries(pdf_document, request, page_numbers):
+    """Thumbnail URL, sprite sheet and deletion state for each of the given pages"""
+    # Thumbnails are served (and rendered on first hit) by the per-page endpoint
+    detail_url = request.build_absolute_uri(
+        reverse('pdfdocument-detail', kwargs={'pk': pdf_document.pk})
+    )
+    pages_deleted = pdf_document.deleted_page_set
+    sprite_pages = settings.THUMBNAIL_SPRITE_PAGES
+    
+    thumbnails = []
+    for page_num in page_numbers:
+        thumbnails.append({
+            'page_number': page_num,
+            'url': f"{detail_url}thumbnails/{page_num}/",
+            'sprite': (page_num - 1) // sprite_pages + 1,
+            'is_deleted': page_num in pages_deleted
+        })
+    
+    return thumbnails
+
+class DocumentDetailSerializer(FieldSelectionMixin, serializers.ModelSerializer):
     filename = serializers.ReadOnlyField()
     active_pages = serializers.ReadOnlyField()
+    active_page_ranges = serializers.ReadOnlyField()
+    pages_deleted_ranges = serializers.ReadOnlyField()
     active_pages_count = serializers.ReadOnlyField()
     deleted_pages_count = serializers.ReadOnlyField()
     thumbnails = serializers.SerializerMethodField()
+    thumbnails_next = serializers.SerializerMethodField()
+    sprites = serializers.SerializerMethodField()
     
     class Meta:
         model = PDFDocument
         fields = [
-            'id', 'filename', 'uploaded_at', 'total_pages', 
-            'pages_deleted', 'thumbnails_generated', 'processing_status',
-            'active_pages', 'active_pages_count', 'deleted_pages_count',
-            'thumbnails'
+            'id', 'filename', 'uploaded_at', 'updated_at', 'total_pages', 
+            'is_encrypted', 'is_linearized', 'text_layer', 'pages_deleted', 'pages_deleted_ranges',
+            'thumbnails_generated', 'thumbnails_done', 'processing_status',
+            'active_pages', 'active_page_ranges', 'active_pages_count', 'deleted_pages_count',
+            'thumbnails', 'thumbnails_next', 'sprites'
         ]
+        # Full page lists grow with the document; the *_ranges fields carry the same data
+        optional_fields = ['pages_deleted', 'active_pages']
+    
+    def get_detail_url(self, obj):
+        return self.context['request'].build_absolute_uri(
+            reverse('pdfdocument-detail', kwargs={'pk': obj.pk})
+        )
     
     def get_thumbnails(self, obj):
-        if not obj.thumbnails_generated:
+        """The first THUMBNAIL_LIST_LIMIT pages; the rest come from thumbnails_next"""
+        last_page = min(obj.total_pages, settings.THUMBNAIL_LIST_LIMIT)
+        return get_thumbnail_entries(obj, self.context['request'], range(1, last_page + 1))
+    
+    def get_thumbnails_next(self, obj):
+        if obj.total_pages <= settings.THUMBNAIL_LIST_LIMIT:
+            return None
+        listing_url = self.context['request'].build_absolute_uri(
+            reverse('pdfdocument-thumbnails', kwargs={'pk': obj.pk})
+        )
+        return f"{listing_url}?offset={settings.THUMBNAIL_LIST_LIMIT}&limit={settings.THUMBNAIL_LIST_LIMIT}"
+    
+    def get_sprites(self, obj):
+        """
+        Sprite sheets covering every page, so the page grid loads in a handful
+        of requests instead of one per page. Pages fill each sheet in row order,
+        so page N's tile is at index N - first_page: column index % columns,
+        row index // columns.
+        """
+        if not obj.total_pages:
             return []
         
-        thumbnails = []
-        for page_num in range(1, obj.total_pages + 1):
-            thumbnail_url = f"{self.context['request'].build_absolute_uri('/media/')}thumbnails/{obj.id}/page_{page_num}.jpg"
-            thumbnails.append({
-                'page_number': page_num,
-                'url': thumbnail_url,
-                'is_deleted': page_num in (obj.pages_deleted or [])
+        detail_url = self.get_detail_url(obj)
+        
+        sprites = []
+        for sheet in range(1, math.ceil(obj.total_pages / settings.THUMBNAIL_SPRITE_PAGES) + 1):
+            first_page, last_page = get_sprite_range(sheet, obj.total_pages)
+            layout = get_sprite_layout(first_page, last_page)
+            sprites.append({
+                'sheet': sheet,
+                'url': f"{detail_url}sprites/{sheet}/",
+                'first_page': first_page,
+                'last_page': last_page,
+                'width': layout['width'],
+                'height': layout['height'],
+                'tile_width': layout['tile_width'],
+                'tile_height': layout['tile_height'],
+                'columns': layout['columns']
             })
         
-        return thumbnails
+        return sprites
 
 class ProcessedDocumentSerializer(serializers.ModelSerializer):
     pdf = PDFDocumentSerializer(read_only=True)
     
     class Meta:
         model = ProcessedDocument
-        fields = ['id', 'pdf', 'extracted_text', 'edited_text', 'audio_file', 'created_at', 'audio_status']
-        read_only_fields = ['id', 'created_at']
\ No newline at end of file
+        fields = ['id', 'pdf', 'extracted_text', 'edited_text', 'audio_file', 'created_at', 'audio_status', 'audio_progress']
+        read_only_fields = ['id', 'created_at', 'audio_file', 'audio_status', 'audio_progress']
+
+class ProcessedDocumentListSerializer(serializers.ModelSerializer):
+    """Processed document summary without the (possibly megabytes of) text"""
+    pdf = PDFDocumentListSerializer(read_only=True)
+    
+    class Meta:
+        model = ProcessedDocument
+        fields = ['id', 'pdf', 'audio_file', 'created_at', 'audio_status', 'audio_progress']
+        read_only_fields = fields
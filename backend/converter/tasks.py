@@ -1,14 +1,497 @@
 from celery import shared_task
-from gtts import gTTS
 from django.conf import settings
+from django.core.files.base import ContentFile
+import logging
 import os
+import time
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Exists, F, Max, OuterRef
+from django.utils import timezone
+
+from . import library_cache
+from .models import AudioSegment, PDFBlob, PDFDocument, PDFPage, ProcessedDocument, UploadSession
+from .audio_cache import AudioSegmentCache
+from .pagesets import PageSet
+from .scheduler import (
+    AUDIO, OCR, PREFETCH, THUMBNAILS, audio_cost, get_scheduler, ocr_cost, prefetch_cost, thumbnail_cost
+)
+from .tts import concatenate_mp3, get_tts_engine, mp3_duration, split_text_into_chunks, synthesize_chunks
+from .utils import (
+    discard_ocr_images, generate_pdf_thumbnails, generate_sprite_sheet, get_pdf_page_count, get_pdf_page_sizes,
+    get_sprite_range, hash_file, iter_ocr_pages, iter_pdf_pages, ocr_available, render_ocr_images, thumbnail_exists
+)
+
+logger = logging.getLogger(__name__)
+
+INGEST_BATCH_SIZE = 500  # Pages written per bulk insert during ingestion
+
+def attach_blob(pdf_document):
+    """
+    Give a document uploaded before deduplication existed a blob for its own file.
+    """
+    content_hash = hash_file(pdf_document.original_file.path)
+    blob, _ = PDFBlob.objects.get_or_create(
+        content_hash=content_hash,
+        defaults={'file': pdf_document.original_file.name, 'size': pdf_document.original_file.size}
+    )
+    pdf_document.blob = blob
+    pdf_document.save(update_fields=['blob'])
+    return blob
+
+def iter_ingest_document(pdf_document):
+    """
+    Make sure the document's content is ingested, yielding (page_number, text)
+    for every page so callers can stream it.
+    New content is parsed once and its page count and per-page sizes and text are
+    stored on the blob; content uploaded before is read back from the page store.
+    Pages are committed in batches, so an interrupted ingestion resumes after the
+    last batch it stored instead of parsing the whole file again.
+    """
+    blob = pdf_document.blob or attach_blob(pdf_document)
+    
+    if blob.ingested:
+        yield from blob.pages.values_list('page_number', 'text').iterator(chunk_size=100)
+    else:
+        stored_pages = blob.pages.aggregate(last=Max('page_number'))['last'] or 0
+        if stored_pages:
+            logger.info(f"Resuming ingestion of PDF {pdf_document.id} after page {stored_pages}")
+            yield from blob.pages.values_list('page_number', 'text').iterator(chunk_size=100)
+        
+        batch = []
+        total_pages = stored_pages
+        for page in iter_pdf_pages(blob.file.path, first_page=stored_pages + 1):
+            batch.append(PDFPage(blob=blob, **page))
+            total_pages += 1
+            if len(batch) >= INGEST_BATCH_SIZE:
+                # Another worker may be ingesting the same content; its rows are identical
+                PDFPage.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+            yield page['page_number'], page['text']
+        PDFPage.objects.bulk_create(batch, ignore_conflicts=True)
+        
+        blob.total_pages = total_pages
+        blob.ingested = True
+        blob.save(update_fields=['total_pages', 'ingested'])
+        logger.info(f"Ingested {total_pages} pages from PDF {pdf_document.id}")
+    
+    if pdf_document.total_pages != blob.total_pages:
+        pdf_document.total_pages = blob.total_pages
+        pdf_document.save(update_fields=['total_pages', 'updated_at'])
+        library_cache.invalidate(pdf_document.user_id)
+
+def ingest_document(pdf_document):
+    """
+    Ingest the document's content without streaming its pages anywhere.
+    Runs outside a transaction so each stored batch survives a crash.
+    """
+    for _ in iter_ingest_document(pdf_document):
+        pass
+    return pdf_document
+
+def reuse_processed_content(pdf_document):
+    """
+    Mark a duplicate upload ready straight away if its content is already ingested
+    and the first screen of thumbnails exists. Returns True if it did.
+    """
+    blob = pdf_document.blob
+    if not (blob and blob.ingested):
+        return False
+    
+    eager_pages = min(blob.total_pages, settings.THUMBNAIL_EAGER_PAGES)
+    if not all(thumbnail_exists(blob.content_hash, page) for page in range(1, eager_pages + 1)):
+        return False
+    
+    pdf_document.total_pages = blob.total_pages
+    pdf_document.thumbnails_done = eager_pages
+    pdf_document.thumbnails_generated = True
+    pdf_document.processing_status = 'ready'
+    pdf_document.save(update_fields=[
+        'total_pages', 'thumbnails_done', 'thumbnails_generated', 'processing_status', 'updated_at'
+    ])
+    library_cache.invalidate(pdf_document.user_id)
+    logger.info(f"Reused processed content {blob.content_hash} for PDF {pdf_document.id}")
+    return True
+
+@shared_task
+def generate_thumbnails_task(document_id):
+    """
+    Render the first screen of thumbnails for an uploaded PDF, then ingest its text.
+    Moves processing_status from 'uploaded' through 'generating_thumbnails'
+    to 'ready' (or 'error') and records per-page progress in thumbnails_done.
+    The first screen only needs page sizes, so it does not wait for text
+    extraction of the whole document. Later pages are rendered on demand by
+    the thumbnail endpoint.
+    Safe to run again after an interruption: stored pages and rendered
+    thumbnails are kept, so only the unfinished work is redone.
+    """
+    try:
+        pdf_document = PDFDocument.objects.get(pk=document_id)
+    except PDFDocument.DoesNotExist:
+        logger.warning(f"PDF {document_id} was deleted before thumbnail generation started")
+        return False
+    
+    if pdf_document.processing_status == 'ready' and pdf_document.ingested:
+        # Redelivered after it had already finished
+        return True
+
+    documents = PDFDocument.objects.filter(pk=document_id)
+    ready = pdf_document.processing_status == 'ready'
+
+    def update_status(**fields):
+        # Status shows in the document list, so its cached pages go stale too
+        documents.update(updated_at=timezone.now(), **fields)
+        library_cache.invalidate(pdf_document.user_id)
+
+    # A file that kills the worker is redelivered and requeued by the sweeper; stop after a few tries
+    documents.update(processing_attempts=F('processing_attempts') + 1)
+    if pdf_document.processing_attempts >= settings.PIPELINE_MAX_ATTEMPTS:
+        if not ready:
+            update_status(processing_status='error')
+        logger.error(f"Giving up on PDF {document_id} after {pdf_document.processing_attempts} attempts")
+        return False
+
+    try:
+        if reuse_processed_content(pdf_document):
+            return True
+
+        if not ready:
+            blob = pdf_document.blob or attach_blob(pdf_document)
+            # From the page store, or the sizes triage recorded; parse the file only for older uploads
+            page_sizes = (
+                pdf_document.get_page_sizes(last_page=settings.THUMBNAIL_EAGER_PAGES)
+                or get_pdf_page_sizes(blob.file.path, last_page=settings.THUMBNAIL_EAGER_PAGES)
+            )
+            if not pdf_document.total_pages:
+                # Uploaded before triage recorded the page count
+                pdf_document.total_pages = get_pdf_page_count(blob.file.path)
+                update_status(total_pages=pdf_document.total_pages)
+            update_status(thumbnails_done=0, processing_status='generating_thumbnails')
+
+            def report_progress(pages_done):
+                documents.update(thumbnails_done=pages_done, updated_at=timezone.now())
+
+            thumbnails = generate_pdf_thumbnails(
+                pdf_document.original_file.path,
+                pdf_document.thumbnail_key,
+                last_page=settings.THUMBNAIL_EAGER_PAGES,
+                progress_callback=report_progress,
+                page_sizes=page_sizes
+            )
+
+            if not thumbnails:
+                update_status(processing_status='error')
+                logger.error(f"Failed to generate thumbnails for PDF {document_id}")
+                return False
+
+            update_status(thumbnails_generated=True, processing_status='ready')
+            ready = True
+
+        # Text is only needed for extraction and audio, so it comes after the first screen
+        ingest_document(pdf_document)
+        logger.info(f"Successfully processed PDF {document_id}")
+        schedule_ocr(pdf_document)
+        return True
+
+    except Exception as e:
+        if not ready:
+            update_status(processing_status='error')
+        # Once ready, text that failed to ingest here is ingested on demand by extract_text
+        logger.error(f"Error processing PDF {document_id}: {e}")
+        return False
+
+def start_processing(pdf_document):
+    """
+    Queue ingestion and thumbnails once the current transaction commits.
+    Duplicates of processed content are marked ready by the worker rather than
+    here, so the upload response is the same whether or not content was reused.
+    """
+    transaction.on_commit(lambda: schedule_thumbnails(pdf_document))
+    logger.info(f"Queued thumbnail generation for PDF {pdf_document.id}")
+
+def schedule_thumbnails(pdf_document):
+    """Queue ingestion and first-screen thumbnails, smallest documents first"""
+    get_scheduler().submit(
+        generate_thumbnails_task, [str(pdf_document.id)], THUMBNAILS,
+        pdf_document.user_id, thumbnail_cost(pdf_document.total_pages, pdf_document.text_layer)
+    )
+
+def schedule_prefetch(pdf_document, first_page, last_page):
+    """Queue rendering of thumbnails the client is about to scroll to"""
+    get_scheduler().submit(
+        prefetch_thumbnails_task, [str(pdf_document.id), first_page, last_page], PREFETCH,
+        pdf_document.user_id, prefetch_cost(last_page - first_page + 1)
+    )
+
+def schedule_sprite(pdf_document, sheet, image_format):
+    """Queue building of a sprite sheet the page grid asked for"""
+    first_page, last_page = get_sprite_range(sheet, pdf_document.total_pages)
+    get_scheduler().submit(
+        sprite_sheet_task, [str(pdf_document.id), sheet, image_format], PREFETCH,
+        pdf_document.user_id, prefetch_cost(last_page - first_page + 1)
+    )
+
+def schedule_ocr(pdf_document):
+    """Queue OCR of the pages that have no text layer, if there are any"""
+    if not ocr_available():
+        return
+    page_count = pdf_document.pages.filter(text='', ocr_done=False).count()
+    if page_count:
+        get_scheduler().submit(
+            ocr_document_task, [str(pdf_document.id)], OCR, pdf_document.user_id, ocr_cost(page_count)
+        )
+    else:
+        # Every page had a text layer after all
+        discard_ocr_images(pdf_document.thumbnail_key)
+
+def schedule_audio(processed_doc, text):
+    """Queue speech synthesis, costed by the length of the text"""
+    get_scheduler().submit(
+        generate_audio_task, [processed_doc.id], AUDIO,
+        processed_doc.pdf.user_id, audio_cost(len(text))
+    )
+
+@shared_task
+def prefetch_thumbnails_task(document_id, first_page, last_page):
+    """
+    Render thumbnails for a page range ahead of the client scrolling to it.
+    """
+    try:
+        pdf_document = PDFDocument.objects.get(pk=document_id)
+    except PDFDocument.DoesNotExist:
+        return False
+
+    last_page = min(last_page, pdf_document.total_pages)
+    thumbnails = generate_pdf_thumbnails(
+        pdf_document.original_file.path,
+        pdf_document.thumbnail_key,
+        first_page=first_page,
+        last_page=last_page,
+        page_sizes=pdf_document.get_page_sizes(first_page, last_page) or None
+    )
+    return bool(thumbnails)
 
 @shared_task
-def generate_audio_task(text, output_path):
+def sprite_sheet_task(document_id, sheet, image_format):
+    """
+    Build one sprite sheet, rendering the thumbnails it covers that are missing.
+    """
     try:
-        tts = gTTS(text=text, lang='en')
-        tts.save(output_path)
+        pdf_document = PDFDocument.objects.get(pk=document_id)
+    except PDFDocument.DoesNotExist:
+        return False
+
+    first_page, last_page = get_sprite_range(sheet, pdf_document.total_pages)
+    sprite_path = generate_sprite_sheet(
+        pdf_document.original_file.path,
+        pdf_document.thumbnail_key,
+        sheet,
+        pdf_document.total_pages,
+        page_sizes=pdf_document.get_page_sizes(first_page, last_page) or None,
+        image_format=image_format
+    )
+    return bool(sprite_path)
+
+@shared_task
+def ocr_document_task(document_id):
+    """
+    Recognize the text of pages without a text layer and store it in their
+    PDFPage rows, so every upload of the same content shares the result.
+    Pages with extracted text are never OCRed. Only those pages are rendered
+    to OCR_DPI images, which are kept until every page is recognized. Each
+    page is recorded as it succeeds, so a rerun only OCRs the pages left.
+    """
+    try:
+        pdf_document = PDFDocument.objects.get(pk=document_id)
+    except PDFDocument.DoesNotExist:
+        return False
+
+    pending = PageSet(pdf_document.pages.filter(text='', ocr_done=False).values_list('page_number', flat=True))
+    if not pending:
+        discard_ocr_images(pdf_document.thumbnail_key)
+        return True
+
+    # updated_at shows the sweeper that the job is alive; pages that keep failing stop being resumed
+    documents = PDFDocument.objects.filter(pk=document_id)
+    documents.update(ocr_attempts=F('ocr_attempts') + 1, updated_at=timezone.now())
+    if pdf_document.ocr_attempts >= settings.PIPELINE_MAX_ATTEMPTS:
+        logger.error(f"Giving up on OCR of PDF {document_id} after {pdf_document.ocr_attempts} attempts")
+        return False
+
+    render_ocr_images(pdf_document.original_file.path, pdf_document.thumbnail_key, pending)
+
+    recognized = failed = 0
+    for page_number, text in iter_ocr_pages(pdf_document.thumbnail_key, pending):
+        documents.update(updated_at=timezone.now())
+        if text is None:
+            # Left pending, so a later run tries the page again
+            failed += 1
+            continue
+        pdf_document.pages.filter(page_number=page_number).update(text=text, ocr_done=True)
+        recognized += bool(text)
+    logger.info(
+        f"OCR found text on {recognized} of {len(pending)} pages of PDF {document_id}"
+        + (f"; {failed} pages failed" if failed else "")
+    )
+    if not failed:
+        discard_ocr_images(pdf_document.thumbnail_key)
+
+    # Text already extracted from this content is missing the recognized pages
+    for processed_doc in ProcessedDocument.objects.select_related('pdf').filter(pdf__blob_id=pdf_document.blob_id):
+        processed_doc.refresh_extracted_text()
+    return True
+
+@shared_task
+def generate_audio_task(processed_document_id):
+    """
+    Synthesize audio for a processed document with the configured TTS engine.
+    The text is split into sentence-bounded chunks that are synthesized in
+    parallel and joined in order. Moves audio_status from 'queued' through
+    'processing' to 'completed' (or 'failed'), reports chunk progress in
+    audio_progress and attaches the MP3 to audio_file.
+    Each chunk is recorded as an AudioSegment as soon as it is done, so the
+    playlist endpoint can start playback before synthesis finishes.
+    """
+    try:
+        processed_doc = ProcessedDocument.objects.select_related('pdf').get(pk=processed_document_id)
+    except ProcessedDocument.DoesNotExist:
+        logger.warning(f"Processed document {processed_document_id} was deleted before audio generation started")
+        return False
+
+    if processed_doc.audio_status == 'completed':
+        # Redelivered after it had already finished
         return True
+
+    documents = ProcessedDocument.objects.filter(pk=processed_document_id)
+    documents.update(audio_attempts=F('audio_attempts') + 1)
+    if processed_doc.audio_attempts >= settings.PIPELINE_MAX_ATTEMPTS:
+        documents.update(audio_status='failed', updated_at=timezone.now())
+        logger.error(
+            f"Giving up on audio for processed document {processed_document_id} "
+            f"after {processed_doc.audio_attempts} attempts"
+        )
+        return False
+    documents.update(audio_status='processing', audio_progress=0, updated_at=timezone.now())
+
+    try:
+        # Use edited text if available, otherwise use extracted text
+        text = processed_doc.edited_text or processed_doc.extracted_text
+        chunks = split_text_into_chunks(text)
+        engine = get_tts_engine()
+        cache = AudioSegmentCache()
+        keys = [cache.make_key(chunk, engine.cache_id, settings.TTS_LANGUAGE) for chunk in chunks]
+
+        # Keep segments an interrupted run finished; only changed chunks start over
+        segments = AudioSegment.objects.filter(document=processed_doc)
+        segments.filter(index__gte=len(chunks)).delete()
+        AudioSegment.objects.bulk_create(
+            [AudioSegment(document=processed_doc, index=index) for index in range(len(chunks))],
+            ignore_conflicts=True
+        )
+        stale = [
+            index for index, cache_key in segments.filter(completed=True).values_list('index', 'cache_key')
+            if cache_key != keys[index]
+        ]
+        segments.filter(index__in=stale).update(cache_key='', duration=0, size=0, completed=False)
+
+        def report_progress(chunks_done):
+            documents.update(audio_progress=int(chunks_done * 100 / len(chunks)), updated_at=timezone.now())
+
+        def segment_done(index, cache_key, data):
+            segments.filter(index=index).update(
+                cache_key=cache_key,
+                duration=mp3_duration(data),
+                size=len(data),
+                completed=True
+            )
+
+        audio = concatenate_mp3(synthesize_chunks(
+            chunks, engine=engine, progress_callback=report_progress, cache=cache, segment_callback=segment_done
+        ))
+        # Segments a playlist still lists must stay servable
+        cache.evict(protected=set(AudioSegment.objects.exclude(cache_key='').values_list('cache_key', flat=True)))
+
+        old_audio = processed_doc.audio_file.name
+        audio_filename = f"audio_{processed_doc.pdf_id}_{int(time.time())}.mp3"
+        processed_doc.audio_file.save(audio_filename, ContentFile(audio), save=False)
+        processed_doc.audio_status = 'completed'
+        processed_doc.audio_progress = 100
+        processed_doc.save(update_fields=['audio_file', 'audio_status', 'audio_progress', 'updated_at'])
+
+        if old_audio and old_audio != processed_doc.audio_file.name:
+            processed_doc.audio_file.storage.delete(old_audio)
+
+        logger.info(f"Generated audio for processed document {processed_document_id}")
+        return True
+
     except Exception as e:
-        # Log error
-        return False
\ No newline at end of file
+        documents.update(audio_status='failed', updated_at=timezone.now())
+        logger.error(f"Error generating audio for processed document {processed_document_id}: {e}")
+        return False
+
+@shared_task
+def resume_stalled_jobs():
+    """
+    Requeue documents, OCR and audio whose job has made no progress for
+    PIPELINE_STALL_TIMEOUT, e.g. because the worker running it died.
+    The jobs skip work that was already recorded, so only the unit in flight is lost.
+    Run periodically by Celery beat (see CELERY_BEAT_SCHEDULE).
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(seconds=settings.PIPELINE_STALL_TIMEOUT)
+    
+    stalled_documents = list(PDFDocument.objects.filter(
+        processing_status__in=['uploaded', 'generating_thumbnails'], updated_at__lt=cutoff
+    ))
+    # Give each resumed job a full timeout of its own before it counts as stalled again
+    PDFDocument.objects.filter(pk__in=[d.pk for d in stalled_documents]).update(updated_at=now)
+    for user_id in {d.user_id for d in stalled_documents}:
+        library_cache.invalidate(user_id)
+    for pdf_document in stalled_documents:
+        logger.warning(f"Resuming stalled processing of PDF {pdf_document.id}")
+        schedule_thumbnails(pdf_document)
+    
+    # OCR runs after a document is ready, so its pages, not the status, show the job is unfinished
+    stalled_ocr = {}
+    if ocr_available():
+        unrecognized = PDFPage.objects.filter(blob_id=OuterRef('blob_id'), text='', ocr_done=False)
+        for pdf_document in PDFDocument.objects.filter(
+            Exists(unrecognized), processing_status='ready', updated_at__lt=cutoff,
+            ocr_attempts__lt=settings.PIPELINE_MAX_ATTEMPTS
+        ):
+            # Pages are shared by content, so one job per blob covers every upload of it
+            stalled_ocr.setdefault(pdf_document.blob_id, pdf_document)
+    PDFDocument.objects.filter(pk__in=[d.pk for d in stalled_ocr.values()]).update(updated_at=now)
+    for pdf_document in stalled_ocr.values():
+        logger.warning(f"Resuming stalled OCR of PDF {pdf_document.id}")
+        schedule_ocr(pdf_document)
+    
+    # 'pending' audio was never requested; only queued or running jobs can stall
+    stalled_audio = list(ProcessedDocument.objects.select_related('pdf').filter(
+        audio_status__in=['queued', 'processing'], updated_at__lt=cutoff
+    ))
+    ProcessedDocument.objects.filter(pk__in=[d.pk for d in stalled_audio]).update(updated_at=now)
+    for processed_doc in stalled_audio:
+        logger.warning(f"Resuming stalled audio generation for processed document {processed_doc.id}")
+        schedule_audio(processed_doc, processed_doc.edited_text or processed_doc.extracted_text)
+    
+    return len(stalled_documents) + len(stalled_ocr) + len(stalled_audio)
+
+@shared_task
+def expire_upload_sessions():
+    """
+    Delete resumable uploads that received no chunk for UPLOAD_SESSION_EXPIRY,
+    along with their part files. Run periodically by Celery beat.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.UPLOAD_SESSION_EXPIRY)
+    expired = UploadSession.objects.filter(status='uploading', updated_at__lt=cutoff)
+    count = 0
+    for session in expired:
+        if os.path.exists(session.path):
+            os.remove(session.path)
+        session.delete()
+        count += 1
+    if count:
+        logger.info(f"Expired {count} abandoned upload sessions")
+    return count
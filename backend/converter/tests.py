@@ -1,3 +1,300 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from PyPDF2 import PdfWriter
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from . import tasks
+from .models import AudioSegment, PDFDocument, ProcessedDocument, UploadSession
+from .scheduler import PREFETCH, InProcessBroker, Scheduler, user_load
+from .uploads import append_to_session
+
+
+class QueryCountTests(TestCase):
+    """
+    Query budgets per endpoint. Counts must not grow with the number of rows,
+    so every test runs against several documents.
+    """
+    DOCUMENTS = 5
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('reader', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        self.documents = []
+        for index in range(self.DOCUMENTS):
+            pdf_document = PDFDocument.objects.create(
+                user=self.user,
+                original_file=f'pdfs/document_{index}.pdf',
+                original_filename=f'document_{index}.pdf',
+                total_pages=30,
+                pages_deleted=[2, 3, 4, 10],
+                processing_status='ready'
+            )
+            ProcessedDocument.objects.create(
+                pdf=pdf_document,
+                extracted_text='Some extracted text. ' * 1000,
+                audio_status='completed'
+            )
+            self.documents.append(pdf_document)
+
+        self.processed_doc = self.documents[0].processeddocument
+        AudioSegment.objects.bulk_create([
+            AudioSegment(document=self.processed_doc, index=index, cache_key=f'{index:064x}',
+                         duration=4.5, completed=True)
+            for index in range(3)
+        ])
+
+    def test_document_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/documents/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), self.DOCUMENTS)
+
+    @override_settings(DOCUMENT_LIST_CACHE=True)
+    def test_document_list_first_page_is_cached(self):
+        self.client.get('/api/documents/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/documents/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_document_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/documents/{self.documents[0].pk}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_document_detail_not_modified(self):
+        url = f'/api/documents/{self.documents[0].pk}/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_document_status(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/documents/{self.documents[0].pk}/status/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_document_thumbnail_listing(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/documents/{self.documents[0].pk}/thumbnails/?limit=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_processed_list(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/processed/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), self.DOCUMENTS)
+        self.assertNotIn('extracted_text', response.data[0])
+
+    def test_processed_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/processed/{self.processed_doc.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['pdf']['id'], str(self.documents[0].pk))
+
+    def test_processed_audio_status(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/processed/{self.processed_doc.pk}/audio_status/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_processed_playlist(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(f'/api/processed/{self.processed_doc.pk}/playlist.m3u8/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content.decode().count('#EXTINF'), 3)
+
+
+class AudioGenerationTests(TestCase):
+    """Audio requests through the worker task, with the offline TTS engine"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name,
+            TTS_CACHE_DIR=f'{media_root.name}/audio_cache',
+            TTS_ENGINE='converter.tts.StubTTSEngine',
+            TTS_CHUNK_MAX_CHARS=200
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        pdf_document = PDFDocument.objects.create(
+            user=self.user,
+            original_file='pdfs/document.pdf',
+            original_filename='document.pdf',
+            total_pages=3,
+            processing_status='ready'
+        )
+        self.processed_doc = ProcessedDocument.objects.create(
+            pdf=pdf_document,
+            extracted_text='A sentence to read aloud. ' * 30
+        )
+
+    def test_generate_audio(self):
+        url = f'/api/processed/{self.processed_doc.pk}/generate_audio/'
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(len(callbacks), 1)
+        self.processed_doc.refresh_from_db()
+        self.assertEqual(self.processed_doc.audio_status, 'queued')
+
+        # A second request while the first is queued is rejected
+        self.assertEqual(self.client.post(url).status_code, 409)
+
+        statuses = []
+
+        def synthesize_chunks(*args, **kwargs):
+            statuses.append(ProcessedDocument.objects.get(pk=self.processed_doc.pk).audio_status)
+            return real_synthesize_chunks(*args, **kwargs)
+
+        real_synthesize_chunks = tasks.synthesize_chunks
+        with mock.patch.object(tasks, 'synthesize_chunks', synthesize_chunks):
+            self.assertTrue(tasks.generate_audio_task(str(self.processed_doc.pk)))
+        self.assertEqual(statuses, ['processing'])
+
+        self.processed_doc.refresh_from_db()
+        self.assertEqual(self.processed_doc.audio_status, 'completed')
+        self.assertEqual(self.processed_doc.audio_progress, 100)
+        self.assertTrue(self.processed_doc.audio_file)
+        segments = AudioSegment.objects.filter(document=self.processed_doc)
+        self.assertGreater(segments.count(), 1)
+        self.assertFalse(segments.filter(completed=False).exists())
+
+
+class UploadSessionTests(TestCase):
+    """Chunked uploads, including chunks cut off midway"""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = override_settings(
+            MEDIA_ROOT=media_root.name,
+            UPLOAD_SESSION_DIR=os.path.join(media_root.name, 'upload_sessions')
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.user = User.objects.create_user('uploader', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+        writer = PdfWriter()
+        for _ in range(3):
+            writer.add_blank_page(width=612, height=792)
+        buffer = io.BytesIO()
+        writer.write(buffer)
+        self.data = buffer.getvalue()
+
+    def append(self, session_id, offset, chunk):
+        return self.client.patch(
+            f'/api/uploads/{session_id}/', chunk,
+            content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset)
+        )
+
+    def test_resume_after_dropped_chunk(self):
+        response = self.client.post('/api/uploads/', {'filename': 'book.pdf', 'length': len(self.data)}, format='json')
+        self.assertEqual(response.status_code, 201)
+        session_id = response.data['id']
+        middle = len(self.data) // 2
+        self.assertEqual(self.append(session_id, 0, self.data[:middle]).status_code, 204)
+
+        # The connection drops after part of the next chunk was written
+        body = io.BytesIO(self.data[middle:])
+
+        def read(size):
+            if body.tell() > 0:
+                raise OSError("Connection reset by peer")
+            return body.read(min(size, 100))
+
+        session = UploadSession.objects.get(pk=session_id)
+        with self.assertRaises(OSError):
+            append_to_session(session, read)
+
+        self.assertEqual(self.append(session_id, middle, self.data[middle:]).status_code, 204)
+        with self.captureOnCommitCallbacks():
+            response = self.client.post(f'/api/uploads/{session_id}/finalize/')
+        self.assertEqual(response.status_code, 202)
+
+        pdf_document = PDFDocument.objects.get(pk=response.data['id'])
+        self.assertEqual(pdf_document.content_hash, hashlib.sha256(self.data).hexdigest())
+        self.assertFalse(os.path.exists(UploadSession.objects.get(pk=session_id).path))
+
+    def test_chunk_for_finished_upload_leaves_no_part_file(self):
+        response = self.client.post('/api/uploads/', {'filename': 'book.pdf', 'length': len(self.data)}, format='json')
+        session_id = response.data['id']
+        self.assertEqual(self.append(session_id, 0, self.data).status_code, 204)
+        with self.captureOnCommitCallbacks():
+            self.client.post(f'/api/uploads/{session_id}/finalize/')
+
+        response = self.append(session_id, len(self.data), b'more')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(os.path.exists(UploadSession.objects.get(pk=session_id).path))
+
+
+class RecordingTask:
+    """Stands in for a Celery task; records the order jobs run in"""
+
+    def __init__(self, name, runs):
+        self.name = name
+        self.runs = runs
+
+    def __call__(self, *args):
+        self.runs.append(self.name)
+
+
+class SchedulerTests(TestCase):
+    """Job order across users with the in-process broker"""
+
+    def setUp(self):
+        self.broker = InProcessBroker()
+        self.scheduler = Scheduler(self.broker)
+        self.runs = []
+        self.heavy = User.objects.create_user('heavy', password='secret')
+        self.light = User.objects.create_user('light', password='secret')
+
+    def submit(self, name, user, cost):
+        self.scheduler.submit(RecordingTask(name, self.runs), [], PREFETCH, user.pk, cost)
+
+    def test_shortest_job_first(self):
+        self.submit('large', self.light, 500)
+        self.submit('small', self.light, 2)
+        self.submit('medium', self.light, 40)
+        self.broker.run_pending()
+        self.assertEqual(self.runs, ['small', 'medium', 'large'])
+
+    def test_busy_user_waits_behind_others(self):
+        for index in range(3):
+            PDFDocument.objects.create(
+                user=self.heavy, original_file=f'pdfs/heavy_{index}.pdf', total_pages=500,
+                processing_status='generating_thumbnails'
+            )
+        self.submit('heavy', self.heavy, 10)
+        self.submit('light', self.light, 10)
+        self.broker.run_pending()
+        self.assertEqual(self.runs, ['light', 'heavy'])
+
+    def test_unrequested_audio_is_not_load(self):
+        pdf_document = PDFDocument.objects.create(
+            user=self.light, original_file='pdfs/read.pdf', total_pages=3, processing_status='ready'
+        )
+        processed_doc = ProcessedDocument.objects.create(pdf=pdf_document, extracted_text='Text')
+        self.assertEqual(user_load(self.light.pk), 0)
+        processed_doc.audio_status = 'queued'
+        processed_doc.save()
+        self.assertEqual(user_load(self.light.pk), 1)
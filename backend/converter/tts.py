@@ -0,0 +1,213 @@
+import io
+import logging
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .audio_cache import AudioSegmentCache
+
+logger = logging.getLogger(__name__)
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_BREAK = re.compile(r'(?<=[.!?;:])\s+')
+
+
+class TTSEngine:
+    """
+    Base class for text-to-speech backends.
+    Engines turn a piece of text into MP3 bytes.
+    """
+
+    voice = 'default'
+
+    @property
+    def cache_id(self):
+        """Identifies the engine and voice in audio cache keys"""
+        return f"{type(self).__module__}.{type(self).__qualname__}:{self.voice}"
+
+    def synthesize(self, text, lang='en'):
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS through gTTS (needs network access)"""
+
+    def synthesize(self, text, lang='en'):
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class StubTTSEngine(TTSEngine):
+    """
+    Offline engine for development and tests.
+    Produces valid silent MP3 whose length roughly matches how long the text
+    would take to read aloud.
+    """
+
+    # MPEG-1 Layer III, 128 kbps, 44.1 kHz, mono; all-zero side info decodes as silence
+    FRAME_HEADER = bytes([0xFF, 0xFB, 0x90, 0xC0])
+    FRAME_SIZE = 417
+    FRAME_DURATION = 1152 / 44100  # Seconds of audio per frame
+    CHARS_PER_SECOND = 15
+
+    def synthesize(self, text, lang='en'):
+        seconds = max(len(text), 1) / self.CHARS_PER_SECOND
+        frame = self.FRAME_HEADER + bytes(self.FRAME_SIZE - len(self.FRAME_HEADER))
+        return frame * math.ceil(seconds / self.FRAME_DURATION)
+
+
+def get_tts_engine():
+    """Instantiate the engine configured by settings.TTS_ENGINE"""
+    return import_string(settings.TTS_ENGINE)()
+
+
+def split_text_into_chunks(text, max_chars=None):
+    """
+    Split text into chunks of at most max_chars characters for synthesis.
+    Chunks never span paragraphs, so editing one paragraph leaves the chunks
+    (and cached audio) of every other paragraph unchanged. Long paragraphs are
+    packed sentence by sentence; only an over-long sentence is split between words.
+    """
+    max_chars = max_chars or settings.TTS_CHUNK_MAX_CHARS
+    
+    chunks = []
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        paragraph = ' '.join(paragraph.split())
+        if len(paragraph) <= max_chars:
+            if paragraph:
+                chunks.append(paragraph)
+            continue
+        
+        current = ''
+        for sentence in SENTENCE_BREAK.split(paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                if current:
+                    chunks.append(current)
+                    current = ''
+                chunks.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = ''
+            current = f"{current} {sentence}" if current else sentence
+        if current:
+            chunks.append(current)
+    return chunks
+
+
+def strip_id3(data):
+    """Remove ID3v2 and ID3v1 tags so MP3 segments can be joined frame to frame"""
+    if data[:3] == b'ID3' and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    if len(data) >= 128 and data[-128:-125] == b'TAG':
+        data = data[:-128]
+    return data
+
+
+# Bitrates (kbps) for Layer III by MPEG version, indexed by the header's bitrate field
+MP3_BITRATES = {
+    3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2
+    0: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],      # MPEG-2.5
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def mp3_duration(data):
+    """Return the playing time of Layer III MP3 data in seconds by walking its frames"""
+    data = strip_id3(data)
+    position = 0
+    duration = 0.0
+    while position + 4 <= len(data):
+        b1, b2, b3 = data[position + 1], data[position + 2], data[position + 3]
+        version = (b1 >> 3) & 0x03
+        bitrate_index = b2 >> 4
+        rate_index = (b2 >> 2) & 0x03
+        if (data[position] != 0xFF or (b1 & 0xE0) != 0xE0 or version == 1 or ((b1 >> 1) & 0x03) != 1
+                or bitrate_index in (0, 15) or rate_index == 3):
+            position += 1  # Not a Layer III frame header; resynchronize
+            continue
+        bitrate = MP3_BITRATES[version][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        samples = 1152 if version == 3 else 576
+        padding = (b2 >> 1) & 0x01
+        position += samples // 8 * bitrate // sample_rate + padding
+        duration += samples / sample_rate
+    return duration
+
+
+def concatenate_mp3(segments):
+    """Join MP3 segments, in order, into one playable MP3"""
+    return b''.join(strip_id3(segment) for segment in segments)
+
+
+def synthesize_with_retry(engine, text, lang, retries=None):
+    """Synthesize one chunk, retrying it on its own with exponential backoff"""
+    retries = settings.TTS_CHUNK_RETRIES if retries is None else retries
+    for attempt in range(retries + 1):
+        try:
+            return engine.synthesize(text, lang=lang)
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"TTS chunk failed ({e}); retrying in {delay}s")
+            time.sleep(delay)
+
+
+def synthesize_chunks(chunks, engine=None, lang=None, progress_callback=None, cache=None,
+                      segment_callback=None):
+    """
+    Synthesize chunks concurrently on up to TTS_MAX_WORKERS threads.
+    Chunks found in the audio cache are not synthesized again, and new
+    segments are added to it.
+    If given, progress_callback is called with the number of chunks done, and
+    segment_callback with (index, cache_key, data) as each segment becomes available.
+    Returns the audio segments in chunk order.
+    """
+    engine = engine or get_tts_engine()
+    lang = lang or settings.TTS_LANGUAGE
+    cache = cache or AudioSegmentCache()
+    segments = [None] * len(chunks)
+    keys = [cache.make_key(chunk, engine.cache_id, lang) for chunk in chunks]
+    
+    chunks_done = 0
+    for index, key in enumerate(keys):
+        segments[index] = cache.get(key)
+        if segments[index] is not None:
+            chunks_done += 1
+            if segment_callback:
+                segment_callback(index, key, segments[index])
+    if chunks_done:
+        logger.info(f"Reused {chunks_done} of {len(chunks)} cached audio segments")
+        if progress_callback:
+            progress_callback(chunks_done)
+    
+    with ThreadPoolExecutor(max_workers=settings.TTS_MAX_WORKERS, thread_name_prefix='tts') as pool:
+        futures = {
+            pool.submit(synthesize_with_retry, engine, chunk, lang): index
+            for index, chunk in enumerate(chunks)
+            if segments[index] is None
+        }
+        for future in as_completed(futures):
+            index = futures[future]
+            segments[index] = future.result()
+            cache.put(keys[index], segments[index])
+            if segment_callback:
+                segment_callback(index, keys[index], segments[index])
+            chunks_done += 1
+            if progress_callback:
+                progress_callback(chunks_done)
+    
+    return segments
@@ -0,0 +1,189 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.uploadhandler import MemoryFileUploadHandler, TemporaryFileUploadHandler
+
+try:
+    import fcntl
+except ImportError:  # Windows: chunks for one session are not serialized across processes
+    fcntl = None
+
+PDF_HEADER = b'%PDF-'
+SESSION_READ_SIZE = 64 * 1024
+MAX_SESSION_HASHERS = 1000
+
+# Upload session id -> (offset, sha256 of the bytes before it), for sessions this process appended to
+_session_hashers = {}
+_session_hashers_lock = threading.Lock()
+
+
+class HashingUploadMixin:
+    """
+    Hash file data while Django receives it, so the content hash is known as soon
+    as the upload completes without reading the file again.
+    The hex digest is set as `content_hash` on the uploaded file.
+    """
+
+    def new_file(self, *args, **kwargs):
+        self.hasher = hashlib.sha256()
+        return super().new_file(*args, **kwargs)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        if uploaded_file is not None:
+            uploaded_file.content_hash = self.hasher.hexdigest()
+        return uploaded_file
+
+
+class HashingMemoryFileUploadHandler(HashingUploadMixin, MemoryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        if self.activated:
+            self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+class HashingTemporaryFileUploadHandler(HashingUploadMixin, TemporaryFileUploadHandler):
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def hash_upload(upload):
+    """
+    Hash an uploaded file that arrived without a content_hash (e.g. from a custom handler).
+    """
+    hasher = hashlib.sha256()
+    for chunk in upload.chunks():
+        hasher.update(chunk)
+    upload.seek(0)
+    return hasher.hexdigest()
+
+
+class UploadError(ValueError):
+    """A chunk that cannot be appended to an upload session"""
+
+
+class UploadInProgress(UploadError):
+    """Another request is appending to the same upload session"""
+
+
+@contextmanager
+def lock_session(session):
+    """
+    Hold an exclusive lock on the session's part file while a chunk is written,
+    so a second chunk for the same session is refused instead of interleaved.
+    The lock is a file lock rather than a row lock, so no database transaction
+    stays open while the body streams in. Raises UploadInProgress if it is held.
+    The part file is only created for a session that has no bytes yet, so a
+    request for a finished session never leaves an empty one behind.
+    """
+    if fcntl is None:
+        yield
+        return
+    
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    try:
+        fd = os.open(session.path, os.O_RDWR | (os.O_CREAT if not session.offset else 0))
+    except FileNotFoundError:
+        raise UploadError("Upload data is missing; start a new upload")
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadInProgress("Another chunk of this upload is in progress")
+        yield
+    finally:
+        os.close(fd)
+
+
+def get_session_hasher(session):
+    """
+    Return a SHA-256 of the session's bytes so far. It is kept in memory between
+    chunks; if another process took the earlier chunks, it is rebuilt from the
+    part file once. The caller gets a copy, so bytes of a chunk that fails
+    midway never reach the kept hasher.
+    """
+    with _session_hashers_lock:
+        offset, hasher = _session_hashers.get(session.id, (None, None))
+    if offset == session.offset:
+        return hasher.copy()
+    
+    hasher = hashlib.sha256()
+    remaining = session.offset
+    with open(session.path, 'rb') as f:
+        while remaining > 0:
+            chunk = f.read(min(SESSION_READ_SIZE, remaining))
+            if not chunk:
+                raise UploadError("Upload data is missing; start a new upload")
+            hasher.update(chunk)
+            remaining -= len(chunk)
+    return hasher
+
+
+def save_session_hasher(session, hasher):
+    with _session_hashers_lock:
+        _session_hashers.pop(session.id, None)
+        if len(_session_hashers) >= MAX_SESSION_HASHERS:
+            # Forget the longest idle session; it will rehash if it comes back
+            _session_hashers.pop(next(iter(_session_hashers)))
+        _session_hashers[session.id] = (session.offset, hasher.copy())
+
+
+def discard_session_hasher(session):
+    with _session_hashers_lock:
+        _session_hashers.pop(session.id, None)
+
+
+def append_to_session(session, read):
+    """
+    Append a request body to an upload session as it streams in, hashing it and
+    checking the PDF header on the way. `read(size)` returns the next bytes of
+    the body. Bytes past session.offset from an interrupted chunk are dropped
+    first. Returns the number of bytes appended; raises UploadError without
+    moving the offset if the chunk is rejected.
+    """
+    os.makedirs(settings.UPLOAD_SESSION_DIR, exist_ok=True)
+    hasher = get_session_hasher(session) if session.offset else hashlib.sha256()
+    position = session.offset
+    
+    try:
+        with open(session.path, 'r+b' if os.path.exists(session.path) else 'w+b') as f:
+            f.seek(position)
+            f.truncate()
+            for chunk in iter(lambda: read(SESSION_READ_SIZE), b''):
+                if position + len(chunk) > session.length:
+                    raise UploadError(f"Chunk goes past the declared upload length of {session.length} bytes")
+                if position < len(PDF_HEADER):
+                    expected = PDF_HEADER[position:position + len(chunk)]
+                    if chunk[:len(expected)] != expected:
+                        raise UploadError("File is not a PDF")
+                f.write(chunk)
+                hasher.update(chunk)
+                position += len(chunk)
+    except BaseException:
+        # Rejected, or the connection dropped midway: the next chunk rehashes from the part file
+        discard_session_hasher(session)
+        raise
+    
+    appended = position - session.offset
+    session.offset = position
+    save_session_hasher(session, hasher)
+    return appended
+
+
+class SessionUpload(File):
+    """
+    The assembled file of a finished upload session. Like Django's temporary
+    uploads it exposes temporary_file_path(), so file system storage moves it
+    into place instead of copying it.
+    """
+
+    def __init__(self, session):
+        super().__init__(open(session.path, 'rb'), name=session.filename)
+
+    def temporary_file_path(self):
+        return self.file.name
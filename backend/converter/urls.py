@@ -6,6 +6,7 @@ from . import views
 router = DefaultRouter()
 router.register(r'documents', views.PDFDocumentViewSet, basename='pdfdocument')
 router.register(r'processed', views.ProcessedDocumentViewSet, basename='processeddocument')
+router.register(r'uploads', views.UploadSessionViewSet, basename='uploadsession')
 
 urlpatterns = [
     # API routes
@@ -1,95 +1,670 @@
+import hashlib
+import math
 import os
-from PIL import Image
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from contextlib import contextmanager
+from PIL import Image, features
 from PyPDF2 import PdfReader
+from PyPDF2.errors import DependencyError, FileNotDecryptedError
 from pdf2image import convert_from_path
 from django.conf import settings
 import logging
 
+from .pagesets import PageSet
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process render limit
+    fcntl = None
+
+try:
+    import pytesseract
+except ImportError:  # Optional: without it, pages with no text layer stay without text
+    pytesseract = None
+
 logger = logging.getLogger(__name__)
 
-def generate_pdf_thumbnails(pdf_path, document_id, max_pages=None):
+THUMBNAIL_SIZE = (200, 280)  # The default tier; page grid tiles and sprite sheets use it
+
+# Pillow format: (file extension, content type, encoder options)
+IMAGE_FORMATS = {
+    'AVIF': ('avif', 'image/avif', {'quality': 50}),
+    'WEBP': ('webp', 'image/webp', {'quality': 75, 'method': 4}),
+    'JPEG': ('jpg', 'image/jpeg', {'quality': 85}),
+}
+
+_render_pool = None
+_render_pool_lock = threading.Lock()
+_ocr_pool = None
+
+def thumbnail_dpi(page_width, page_height, size=THUMBNAIL_SIZE):
+    """
+    Return the DPI at which a page of the given size (in PDF points) just fits
+    the thumbnail box, so poppler never renders pixels we would throw away.
+    """
+    scale = min(size[0] / page_width, size[1] / page_height)
+    return max(1, math.ceil(scale * 72))
+
+def get_page_size(page):
+    """
+    Get the (width, height) of a PyPDF2 page in points, accounting for page rotation.
+    """
+    width = float(page.mediabox.width)
+    height = float(page.mediabox.height)
+    if page.get('/Rotate', 0) % 180:
+        width, height = height, width
+    return width, height
+
+def get_pdf_page_sizes(pdf_path, first_page=1, last_page=None):
+    """
+    Get the (width, height) of pages first_page..last_page (default: to the end)
+    in points, keyed by page number.
+    Only page boxes are read; page content and text are not parsed.
+    """
+    reader = PdfReader(pdf_path)
+    last_page = min(last_page or len(reader.pages), len(reader.pages))
+    return {page_num: get_page_size(reader.pages[page_num - 1]) for page_num in range(first_page, last_page + 1)}
+
+def get_thumbnail_formats():
+    """
+    Return the THUMBNAIL_FORMATS this Pillow build can encode, in order of
+    preference. JPEG is always included last as the universal fallback.
+    """
+    formats = []
+    for image_format in settings.THUMBNAIL_FORMATS:
+        if image_format == 'JPEG' or image_format not in IMAGE_FORMATS:
+            continue
+        try:
+            if features.check(image_format.lower()):
+                formats.append(image_format)
+        except ValueError:  # Feature unknown to this Pillow version
+            pass
+    return formats + ['JPEG']
+
+def get_stored_thumbnail_formats():
+    """
+    Return the formats every rendered page is saved in: the preferred formats
+    without the JPEG fallback, which is encoded on demand (see get_thumbnail).
+    Only JPEG is stored when Pillow can encode nothing better.
+    """
+    formats = get_thumbnail_formats()
+    return formats[:-1] or formats
+
+def parse_accept_header(accept_header):
+    """
+    Return {media range: q-value} for an Accept header. Malformed q-values
+    count as 0, so they never select a format.
+    """
+    accepted = {}
+    for entry in (accept_header or '').split(','):
+        media_range, *params = [part.strip() for part in entry.split(';')]
+        if not media_range:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[media_range.lower()] = max(quality, accepted.get(media_range.lower(), 0.0))
+    return accepted
+
+def negotiate_image_format(accept_header):
+    """
+    Pick the thumbnail format the client rates highest, preferring the order of
+    THUMBNAIL_FORMATS on ties. Only exact media types select AVIF or WebP, as
+    image/* is also sent by clients that cannot decode them; JPEG is the fallback.
+    """
+    accepted = parse_accept_header(accept_header)
+    best_format, best_quality = 'JPEG', 0.0
+    for image_format in get_thumbnail_formats():
+        quality = accepted.get(IMAGE_FORMATS[image_format][1], 0.0)
+        if quality > best_quality:
+            best_format, best_quality = image_format, quality
+    return best_format
+
+def get_largest_tier_size():
+    """
+    Return the biggest THUMBNAIL_TIERS box; pages are rendered once at the DPI it needs.
+    """
+    return max(settings.THUMBNAIL_TIERS.values(), key=lambda size: size[0] * size[1])
+
+def save_image(image, path, image_format, options=None):
+    """
+    Encode an image to a temporary file and move it into place, so concurrent
+    readers and existence checks never see a partly written file.
+    options defaults to the IMAGE_FORMATS encoder options of the format.
+    """
+    if options is None:
+        options = IMAGE_FORMATS[image_format][2]
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp-', suffix=os.path.splitext(path)[1], dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            image.save(f, image_format, **options)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+def save_thumbnail(image, thumb_path, size=THUMBNAIL_SIZE, image_format='JPEG'):
+    """
+    Fit a rendered page into the thumbnail box on a white canvas and save it.
+    The image is shrunk in place, so smaller tiers can be cut from it in turn.
+    """
+    image.thumbnail(size, Image.Resampling.LANCZOS)
+    
+    # Create a white background image for consistent sizing
+    background = Image.new('RGB', size, 'white')
+    
+    # Calculate position to center the thumbnail
+    x = (size[0] - image.width) // 2
+    y = (size[1] - image.height) // 2
+    
+    # Paste the thumbnail onto the background and save
+    background.paste(image, (x, y))
+    save_image(background, thumb_path, image_format)
+
+def save_thumbnail_tiers(image, thumbnail_key, page_number):
+    """
+    Save every THUMBNAIL_TIERS size of a rendered page in the stored thumbnail formats,
+    from the largest tier down so each is resized from the one before.
+    """
+    tiers = sorted(settings.THUMBNAIL_TIERS.items(), key=lambda item: item[1][0] * item[1][1], reverse=True)
+    image = image.convert('RGB')
+    for tier, size in tiers:
+        for image_format in get_stored_thumbnail_formats():
+            save_thumbnail(image, get_thumbnail_path(thumbnail_key, page_number, tier, image_format), size, image_format)
+
+@contextmanager
+def render_slot():
+    """
+    Hold one of THUMBNAIL_RENDER_MAX_PROCESSES machine-wide render slots.
+    Slots are lock files, so the limit holds across every web and Celery process.
+    """
+    if fcntl is None:
+        yield
+        return
+    
+    lock_dir = settings.THUMBNAIL_RENDER_LOCK_DIR
+    os.makedirs(lock_dir, exist_ok=True)
+    while True:
+        for slot in range(settings.THUMBNAIL_RENDER_MAX_PROCESSES):
+            fd = os.open(os.path.join(lock_dir, f"slot_{slot}.lock"), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                continue
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+            return
+        time.sleep(0.05)
+
+def get_render_pool():
+    """
+    Return the process-wide pool that drives poppler renders.
+    Each thread waits on its own pdftoppm process, so renders use separate cores.
+    """
+    global _render_pool
+    with _render_pool_lock:
+        if _render_pool is None:
+            _render_pool = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_RENDER_MAX_PROCESSES,
+                thread_name_prefix='thumbnail-render'
+            )
+        return _render_pool
+
+def render_thumbnail_range(pdf_path, thumbnail_key, first_page, last_page, dpi, ocr=False):
+    """
+    Render pages first_page..last_page once each and save all their thumbnail
+    tiers and formats. Pages are decoded one at a time. Returns the page numbers written.
+    With ocr, pages are rendered at OCR_DPI or more and a grayscale page image is
+    kept for OCR too; thumbnails that already exist are not saved again.
+    """
+    rendered = []
+    if ocr:
+        dpi = max(dpi, settings.OCR_DPI)
+        os.makedirs(get_ocr_image_dir(thumbnail_key), exist_ok=True)
+    with tempfile.TemporaryDirectory() as render_dir:
+        with render_slot():
+            # Let poppler write the range to disk; we decode one page at a time
+            image_paths = convert_from_path(
+                pdf_path, dpi=dpi, first_page=first_page, last_page=last_page,
+                output_folder=render_dir, paths_only=True
+            )
+        
+        for page_number, image_path in enumerate(image_paths, first_page):
+            with Image.open(image_path) as image:
+                if ocr:
+                    save_image(image.convert('L'), get_ocr_image_path(thumbnail_key, page_number), 'PNG', {})
+                if not (ocr and thumbnail_exists(thumbnail_key, page_number)):
+                    save_thumbnail_tiers(image, thumbnail_key, page_number)
+            rendered.append(page_number)
+    return rendered
+
+def get_thumbnail_dir(thumbnail_key):
+    """
+    Return the directory holding thumbnails for a thumbnail key (content hash, or
+    document ID for uploads that predate deduplication): media/thumbnails/<key>/
+    """
+    return os.path.join(settings.MEDIA_ROOT, 'thumbnails', str(thumbnail_key))
+
+def get_thumbnail_path(thumbnail_key, page_number, tier=None, image_format='JPEG'):
     """
-    Generate thumbnails from a PDF file and save them organized by document ID.
+    Return the path of a single page thumbnail, whether or not it has been rendered yet.
+    The default tier as JPEG is page_N.jpg; other outputs are page_N_<tier>.<ext>.
+    """
+    tier = tier or settings.THUMBNAIL_DEFAULT_TIER
+    extension = IMAGE_FORMATS[image_format][0]
+    if tier == settings.THUMBNAIL_DEFAULT_TIER and image_format == 'JPEG':
+        filename = f"page_{page_number}.jpg"
+    else:
+        filename = f"page_{page_number}_{tier}.{extension}"
+    return os.path.join(get_thumbnail_dir(thumbnail_key), filename)
+
+def get_ocr_image_dir(thumbnail_key):
+    """Page images rendered for OCR; they are removed once the pages are recognized"""
+    return os.path.join(get_thumbnail_dir(thumbnail_key), 'ocr')
+
+def get_ocr_image_path(thumbnail_key, page_number):
+    return os.path.join(get_ocr_image_dir(thumbnail_key), f"page_{page_number}.png")
+
+def thumbnail_exists(thumbnail_key, page_number):
+    """
+    Check that every tier of a page thumbnail has been written in the stored formats.
+    """
+    return all(
+        os.path.exists(get_thumbnail_path(thumbnail_key, page_number, tier, image_format))
+        for tier in settings.THUMBNAIL_TIERS
+        for image_format in get_stored_thumbnail_formats()
+    )
+
+def find_thumbnail(thumbnail_key, page_number, tier=None):
+    """
+    Return the path of a rendered thumbnail of a page in any format, or None
+    if the page has not been rendered yet.
+    """
+    for image_format in get_stored_thumbnail_formats() + ['JPEG']:
+        thumb_path = get_thumbnail_path(thumbnail_key, page_number, tier, image_format)
+        if os.path.exists(thumb_path):
+            return thumb_path
+    return None
+
+def get_thumbnail(thumbnail_key, page_number, tier=None, image_format='JPEG'):
+    """
+    Return the path of a page thumbnail in image_format, encoding it from a
+    stored format on first request (the JPEG fallback is not stored up front).
+    Returns None if the page has not been rendered yet.
+    """
+    thumb_path = get_thumbnail_path(thumbnail_key, page_number, tier, image_format)
+    if os.path.exists(thumb_path):
+        return thumb_path
+    
+    source_path = find_thumbnail(thumbnail_key, page_number, tier)
+    if source_path is None:
+        return None
+    with Image.open(source_path) as image:
+        save_image(image.convert('RGB'), thumb_path, image_format)
+    return thumb_path
+
+def generate_pdf_thumbnails(pdf_path, thumbnail_key, first_page=1, last_page=None, progress_callback=None,
+                            page_sizes=None):
+    """
+    Generate thumbnails for pages first_page..last_page (default: to the end) and save
+    them under the thumbnail key, so every upload of the same content shares them.
+    Pages that already have a thumbnail are skipped.
+    page_sizes maps page numbers to (width, height) in points, as stored at ingestion;
+    without it the PDF is parsed to find them.
+    Missing pages are split into THUMBNAIL_CHUNK_SIZE ranges and up to
+    THUMBNAIL_RENDER_WORKERS ranges are rendered in parallel; memory use does not
+    grow with page count.
+    If given, progress_callback is called with the number of pages done after each range.
     Returns a list of thumbnail info dictionaries.
     """
     try:
-        # Create directory structure: media/thumbnails/document_id/
-        thumbnail_dir = os.path.join(settings.MEDIA_ROOT, 'thumbnails', str(document_id))
+        thumbnail_dir = get_thumbnail_dir(thumbnail_key)
         os.makedirs(thumbnail_dir, exist_ok=True)
         
-        # Convert PDF pages to images
-        if max_pages:
-            images = convert_from_path(pdf_path, dpi=150, first_page=1, last_page=max_pages)
-        else:
-            images = convert_from_path(pdf_path, dpi=150)
+        if page_sizes is None:
+            page_sizes = get_pdf_page_sizes(pdf_path, first_page, last_page)
+        last_page = min(last_page or max(page_sizes), max(page_sizes))
         
-        thumbnails = []
+        # Split the pages still missing a thumbnail into contiguous ranges
+        chunk_size = settings.THUMBNAIL_CHUNK_SIZE
+        page_ranges = []
+        range_start = None
+        for page_number in range(first_page, last_page + 2):
+            missing = page_number <= last_page and not thumbnail_exists(thumbnail_key, page_number)
+            if missing and range_start is None:
+                range_start = page_number
+            if range_start is not None and (not missing or page_number - range_start == chunk_size):
+                range_end = page_number - 1
+                # Highest DPI any page in the range needs to fill the largest tier
+                dpi = max(
+                    thumbnail_dpi(*page_sizes[page], size=get_largest_tier_size())
+                    for page in range(range_start, range_end + 1)
+                )
+                page_ranges.append((range_start, range_end, dpi))
+                range_start = page_number if missing else None
         
-        for i, image in enumerate(images):
-            # Resize to thumbnail (200x280 to maintain aspect ratio)
-            image.thumbnail((200, 280), Image.Resampling.LANCZOS)
-            
-            # Create a white background image for consistent sizing
-            background = Image.new('RGB', (200, 280), 'white')
-            
-            # Calculate position to center the thumbnail
-            x = (200 - image.width) // 2
-            y = (280 - image.height) // 2
-            
-            # Paste the thumbnail onto the background
-            background.paste(image, (x, y))
+        pool = get_render_pool()
+        pending = set()
+        pages_done = (last_page - first_page + 1) - sum(end - start + 1 for start, end, _ in page_ranges)
+        
+        # Keep at most THUMBNAIL_RENDER_WORKERS ranges of this document in flight
+        while page_ranges or pending:
+            while page_ranges and len(pending) < settings.THUMBNAIL_RENDER_WORKERS:
+                range_start, range_end, dpi = page_ranges.pop(0)
+                pending.add(pool.submit(
+                    render_thumbnail_range, pdf_path, thumbnail_key, range_start, range_end, dpi
+                ))
             
-            # Save thumbnail
-            thumb_filename = f"page_{i+1}.jpg"
-            thumb_path = os.path.join(thumbnail_dir, thumb_filename)
-            background.save(thumb_path, "JPEG", quality=85)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pages_done += len(future.result())
             
-            # Store thumbnail info
+            if progress_callback:
+                progress_callback(pages_done)
+        
+        thumbnails = []
+        for page_number in range(first_page, last_page + 1):
+            thumb_filename = f"page_{page_number}.jpg"
             thumbnails.append({
-                'page_number': i + 1,
+                'page_number': page_number,
                 'filename': thumb_filename,
-                'path': thumb_path,
-                'url': f"{settings.MEDIA_URL}thumbnails/{document_id}/{thumb_filename}"
+                'path': os.path.join(thumbnail_dir, thumb_filename),
+                'url': f"{settings.MEDIA_URL}thumbnails/{thumbnail_key}/{thumb_filename}"
             })
         
-        logger.info(f"Generated {len(thumbnails)} thumbnails for document {document_id}")
+        logger.info(f"Generated {len(thumbnails)} thumbnails for {thumbnail_key}")
         return thumbnails
         
     except Exception as e:
-        logger.error(f"Error generating thumbnails for document {document_id}: {e}")
+        logger.error(f"Error generating thumbnails for {thumbnail_key}: {e}")
         return []
 
-def extract_pdf_text(pdf_path, excluded_pages=None):
+def get_sprite_range(sheet, total_pages):
     """
-    Extract text from a PDF file, excluding specified pages.
-    Returns the extracted text as a string.
+    Return the (first_page, last_page) covered by a 1-based sprite sheet number.
+    """
+    first_page = (sheet - 1) * settings.THUMBNAIL_SPRITE_PAGES + 1
+    return first_page, min(first_page + settings.THUMBNAIL_SPRITE_PAGES - 1, total_pages)
+
+def get_sprite_layout(first_page, last_page, size=THUMBNAIL_SIZE):
     """
+    Lay pages first_page..last_page out in a grid of THUMBNAIL_SPRITE_COLUMNS tiles.
+    Returns the sheet size, the column count and the (x, y) offset of each page's tile.
+    """
+    page_count = last_page - first_page + 1
+    columns = min(settings.THUMBNAIL_SPRITE_COLUMNS, page_count)
+    rows = math.ceil(page_count / columns)
+    return {
+        'width': columns * size[0],
+        'height': rows * size[1],
+        'tile_width': size[0],
+        'tile_height': size[1],
+        'columns': columns,
+        'offsets': {
+            page_number: ((index % columns) * size[0], (index // columns) * size[1])
+            for index, page_number in enumerate(range(first_page, last_page + 1))
+        }
+    }
+
+def get_sprite_path(thumbnail_key, sheet, image_format='JPEG'):
+    """
+    Return the path of a sprite sheet, whether or not it has been built yet.
+    """
+    extension = IMAGE_FORMATS[image_format][0]
+    return os.path.join(get_thumbnail_dir(thumbnail_key), f"sprite_{sheet}.{extension}")
+
+def generate_sprite_sheet(pdf_path, thumbnail_key, sheet, total_pages, page_sizes=None, image_format='JPEG'):
+    """
+    Build one sprite sheet in image_format from the default tier thumbnails it
+    covers, rendering any that are missing first. The sheet is written atomically, so concurrent builders
+    never serve a partial image. Returns the sheet path, or None on failure.
+    """
+    sprite_path = get_sprite_path(thumbnail_key, sheet, image_format)
+    if os.path.exists(sprite_path):
+        return sprite_path
+    
     try:
-        if excluded_pages is None:
-            excluded_pages = []
+        first_page, last_page = get_sprite_range(sheet, total_pages)
+        generate_pdf_thumbnails(pdf_path, thumbnail_key, first_page, last_page, page_sizes=page_sizes)
         
-        # Convert to set of integers for faster lookup
-        excluded_set = set(int(page) for page in excluded_pages)
+        layout = get_sprite_layout(first_page, last_page)
+        sprite = Image.new('RGB', (layout['width'], layout['height']), 'white')
+        for page_number, offset in layout['offsets'].items():
+            with Image.open(find_thumbnail(thumbnail_key, page_number)) as thumbnail:
+                sprite.paste(thumbnail, offset)
         
-        reader = PdfReader(pdf_path)
-        extracted_text = ""
+        save_image(sprite, sprite_path, image_format)
         
-        for page_num, page in enumerate(reader.pages, 1):
-            # Skip excluded pages
-            if page_num not in excluded_set:
-                try:
-                    page_text = page.extract_text()
-                    if page_text.strip():  # Only add non-empty text
-                        extracted_text += f"\n--- Page {page_num} ---\n"
-                        extracted_text += page_text
-                        extracted_text += "\n"
-                except Exception as e:
-                    logger.warning(f"Could not extract text from page {page_num}: {e}")
-                    continue
+        logger.info(f"Built sprite sheet {sheet} (pages {first_page}-{last_page}) for {thumbnail_key}")
+        return sprite_path
         
-        logger.info(f"Extracted text from {len(reader.pages) - len(excluded_set)} pages")
-        return extracted_text.strip()
+    except Exception as e:
+        logger.error(f"Error building sprite sheet {sheet} for {thumbnail_key}: {e}")
+        return None
+
+class PDFTriageError(ValueError):
+    """A PDF that cannot be processed, found before any rendering"""
+
+def triage_pdf(source):
+    """
+    Inspect a PDF (path or seekable file) cheaply, without decoding page content:
+    the trailer and xref give encryption and the page tree, the first KB shows
+    linearization, and the fonts of a few sampled pages estimate how much of the
+    document has a text layer. Returns a dict of PDFDocument fields; raises
+    PDFTriageError for files that cannot be processed.
+    """
+    try:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+            head = source.read(1024)
+            source.seek(0)
+        else:
+            with open(source, 'rb') as f:
+                head = f.read(1024)
         
+        # PyPDF2 tries the empty user password itself, so owner-password-only files open
+        reader = PdfReader(source)
+        total_pages = len(reader.pages)
+    except (FileNotDecryptedError, DependencyError) as e:
+        raise PDFTriageError("Password-protected PDFs are not supported") from e
+    except Exception as e:
+        raise PDFTriageError(f"File is not a readable PDF: {e}") from e
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+    
+    if not total_pages:
+        raise PDFTriageError("PDF has no pages")
+    
+    # Sizes of the first screen, so the thumbnail task need not open the file just for them
+    try:
+        eager_page_sizes = [
+            list(get_page_size(reader.pages[index]))
+            for index in range(min(total_pages, settings.THUMBNAIL_EAGER_PAGES))
+        ]
+    except Exception as e:
+        logger.warning(f"Could not read page sizes during triage: {e}")
+        eager_page_sizes = []
+    
+    # Pages with fonts in their resources carry text; the rest are images only
+    sample_size = min(total_pages, settings.TRIAGE_SAMPLE_PAGES)
+    sample = sorted({round(index * (total_pages - 1) / max(sample_size - 1, 1)) for index in range(sample_size)})
+    pages_with_text = 0
+    for index in sample:
+        try:
+            # Subscripting resolves indirect references, which .get() returns unresolved
+            page = reader.pages[index]
+            resources = page['/Resources'] if '/Resources' in page else {}
+            if '/Font' in resources and resources['/Font']:
+                pages_with_text += 1
+        except Exception as e:
+            logger.warning(f"Could not inspect resources of page {index + 1}: {e}")
+    
+    return {
+        'total_pages': total_pages,
+        'is_encrypted': reader.is_encrypted,
+        'is_linearized': b'/Linearized' in head,
+        'text_layer': pages_with_text / len(sample),
+        'eager_page_sizes': eager_page_sizes
+    }
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """
+    Return the SHA-256 hex digest of a file, reading it in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def extract_page_text(page, page_num):
+    """
+    Extract the text of one PyPDF2 page, returning an empty string on failure.
+    """
+    try:
+        return page.extract_text() or ""
+    except Exception as e:
+        logger.warning(f"Could not extract text from page {page_num}: {e}")
+        return ""
+
+def ocr_available():
+    """Whether pages without a text layer can be OCRed here"""
+    return pytesseract is not None and settings.OCR_ENABLED
+
+def get_ocr_pool():
+    """
+    Return the process-wide pool that drives Tesseract.
+    Each thread waits on its own tesseract process, so pages are recognized on separate cores.
+    """
+    global _ocr_pool
+    with _render_pool_lock:
+        if _ocr_pool is None:
+            _ocr_pool = ThreadPoolExecutor(max_workers=settings.OCR_WORKERS, thread_name_prefix='ocr')
+        return _ocr_pool
+
+def render_ocr_images(pdf_path, thumbnail_key, page_numbers):
+    """
+    Render OCR_DPI images of the given pages that do not have one yet, in
+    THUMBNAIL_CHUNK_SIZE ranges on the render pool. Thumbnails still missing
+    for those pages are saved from the same render.
+    """
+    missing = PageSet(
+        page_number for page_number in page_numbers
+        if not os.path.exists(get_ocr_image_path(thumbnail_key, page_number))
+    )
+    chunk_size = settings.THUMBNAIL_CHUNK_SIZE
+    pool = get_render_pool()
+    futures = [
+        pool.submit(
+            render_thumbnail_range, pdf_path, thumbnail_key,
+            range_start, min(range_start + chunk_size - 1, last_page), settings.OCR_DPI, True
+        )
+        for first_page, last_page in missing.ranges()
+        for range_start in range(first_page, last_page + 1, chunk_size)
+    ]
+    for future in futures:
+        try:
+            future.result()
+        except Exception as e:
+            # Pages left without an image fail OCR and stay pending
+            logger.error(f"Error rendering OCR images for {thumbnail_key}: {e}")
+
+def discard_ocr_images(thumbnail_key):
+    """Remove the page images kept for OCR"""
+    shutil.rmtree(get_ocr_image_dir(thumbnail_key), ignore_errors=True)
+
+def ocr_image(image_path, lang=None):
+    """
+    Recognize the text of one page image. Returns None on failure, so the page
+    can be tried again, as opposed to an empty string for a page with no text.
+    Runs in a render slot, so OCR and poppler share the machine-wide limit.
+    """
+    try:
+        with render_slot(), Image.open(image_path) as image:
+            return pytesseract.image_to_string(image, lang=lang or settings.OCR_LANGUAGE).strip()
+    except Exception as e:
+        logger.warning(f"Could not OCR {image_path}: {e}")
+        return None
+
+def iter_ocr_pages(thumbnail_key, page_numbers):
+    """
+    OCR pages from the images rendered for them (see render_ocr_images).
+    Yields (page_number, text) as pages finish; text is None for a failed page.
+    """
+    pool = get_ocr_pool()
+    futures = {
+        pool.submit(ocr_image, get_ocr_image_path(thumbnail_key, page_number)): page_number
+        for page_number in page_numbers
+    }
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+def iter_pdf_pages(pdf_path, first_page=1):
+    """
+    Parse a PDF once, yielding a dictionary per page as soon as it is parsed
+    with page_number, width, height (in points) and extracted text.
+    Pages before first_page are skipped without extracting their text.
+    """
+    reader = PdfReader(pdf_path)
+    for page_num in range(first_page, len(reader.pages) + 1):
+        page = reader.pages[page_num - 1]
+        width, height = get_page_size(page)
+        yield {
+            'page_number': page_num,
+            'width': width,
+            'height': height,
+            'text': extract_page_text(page, page_num)
+        }
+
+def iter_pdf_text(pdf_path, excluded_pages=None):
+    """
+    Yield (page_number, text) for each page not in excluded_pages as it is parsed.
+    Memory use is bounded by the largest page, not the document.
+    """
+    excluded_set = PageSet(excluded_pages or [])
+    reader = PdfReader(pdf_path)
+    for page_num, page in enumerate(reader.pages, 1):
+        if page_num not in excluded_set:
+            yield page_num, extract_page_text(page, page_num)
+
+def format_page_text(page_num, text):
+    """
+    Format one page of text the way it appears in ProcessedDocument.extracted_text.
+    """
+    return f"\n--- Page {page_num} ---\n{text}\n"
+
+def join_page_texts(page_texts):
+    """
+    Join (page_number, text) pairs into the document text format used by
+    ProcessedDocument, skipping pages without text.
+    """
+    return "".join(
+        format_page_text(page_num, text)
+        for page_num, text in page_texts
+        if text.strip()
+    ).strip()
+
+def extract_pdf_text(pdf_path, excluded_pages=None):
+    """
+    Extract text from a PDF file, excluding specified pages.
+    Returns the extracted text as a string.
+    """
+    try:
+        return join_page_texts(iter_pdf_text(pdf_path, excluded_pages))
     except Exception as e:
         logger.error(f"Error extracting text from PDF: {e}")
         return ""
@@ -110,7 +685,7 @@ def cleanup_thumbnails(document_id):
     Clean up thumbnail files for a document.
     """
     try:
-        thumbnail_dir = os.path.join(settings.MEDIA_ROOT, 'thumbnails', str(document_id))
+        thumbnail_dir = get_thumbnail_dir(document_id)
         if os.path.exists(thumbnail_dir):
             import shutil
             shutil.rmtree(thumbnail_dir)
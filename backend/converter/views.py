@@ -1,37 +1,72 @@
-from rest_framework import viewsets, status
-from rest_framework.decorators import action
+from rest_framework import mixins, viewsets, status
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
 from django.shortcuts import get_object_or_404
-from django.http import JsonResponse
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils import timezone
+from django.utils.http import http_date
 from django.views.decorators.http import require_http_methods
 from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
+import hashlib
 import logging
+import math
+import mimetypes
 import os
+import posixpath
+import uuid
 from django.conf import settings
 
-from .models import PDFDocument, ProcessedDocument
+from . import library_cache
+from .audio_cache import AudioSegmentCache
+from .media import MediaContentNegotiation, serve_file
+from .uploads import (
+    SessionUpload, UploadError, UploadInProgress, append_to_session, discard_session_hasher, get_session_hasher,
+    lock_session
+)
+from .pagination import DocumentCursorPagination, ThumbnailPagination
+from .models import AudioSegment, PDFDocument, ProcessedDocument, UploadSession
 from .serializers import (
-    PDFDocumentSerializer, PDFUploadSerializer, PageSelectionSerializer,
-    DocumentDetailSerializer, ProcessedDocumentSerializer
+    PDFDocumentSerializer, PDFDocumentListSerializer, PDFUploadSerializer, PageSelectionSerializer,
+    DocumentDetailSerializer, ProcessedDocumentSerializer, ProcessedDocumentListSerializer,
+    UploadSessionSerializer, get_thumbnail_entries
+)
+from .utils import (
+    IMAGE_FORMATS, PDFTriageError, format_page_text, generate_pdf_thumbnails, get_sprite_path,
+    get_thumbnail, negotiate_image_format, thumbnail_exists, triage_pdf
+)
+from .tasks import (
+    ingest_document, iter_ingest_document, start_processing, schedule_audio, schedule_prefetch, schedule_sprite
 )
-from .utils import generate_pdf_thumbnails, extract_pdf_text, get_pdf_page_count
-from .tasks import generate_audio_task
 
 logger = logging.getLogger(__name__)
 
 class PDFDocumentViewSet(viewsets.ModelViewSet):
     serializer_class = PDFDocumentSerializer
     permission_classes = [IsAuthenticated]
-    parser_classes = [MultiPartParser, FormParser]
+    parser_classes = [MultiPartParser, FormParser, JSONParser]
+    pagination_class = DocumentCursorPagination
     
     def get_queryset(self):
-        return PDFDocument.objects.filter(user=self.request.user)
+        documents = PDFDocument.objects.filter(user=self.request.user)
+        if self.action == 'list':
+            # Only what PDFDocumentListSerializer reads
+            documents = documents.only(
+                'id', 'user_id', 'original_file', 'original_filename', 'uploaded_at', 'updated_at',
+                'total_pages', 'pages_deleted', 'thumbnails_generated', 'processing_status'
+            )
+        return documents
     
     def get_serializer_class(self):
-        if self.action == 'create':
+        if self.action == 'list':
+            return PDFDocumentListSerializer
+        elif self.action == 'create':
             return PDFUploadSerializer
         elif self.action == 'retrieve':
             return DocumentDetailSerializer
@@ -40,87 +75,118 @@ class PDFDocumentViewSet(viewsets.ModelViewSet):
         return PDFDocumentSerializer
     
     def create(self, request, *args, **kwargs):
-        """Upload a new PDF and start processing"""
+        """Upload a new PDF and queue thumbnail generation"""
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         
-        # Create the document
+        # Create the document; page count and thumbnails are filled in by the worker
         pdf_document = serializer.save()
+        library_cache.invalidate(request.user.pk)
         
-        try:
-            # Get page count
-            pdf_document.total_pages = get_pdf_page_count(pdf_document.original_file.path)
-            pdf_document.processing_status = 'generating_thumbnails'
-            pdf_document.save()
-            
-            # Generate thumbnails
-            thumbnails = generate_pdf_thumbnails(
-                pdf_document.original_file.path, 
-                pdf_document.id
-            )
-            
-            if thumbnails:
-                pdf_document.thumbnails_generated = True
-                pdf_document.processing_status = 'ready'
-                pdf_document.save()
-                logger.info(f"Successfully processed PDF {pdf_document.id}")
-            else:
-                pdf_document.processing_status = 'error'
-                pdf_document.save()
-                logger.error(f"Failed to generate thumbnails for PDF {pdf_document.id}")
-                
-        except Exception as e:
-            pdf_document.processing_status = 'error'
-            pdf_document.save()
-            logger.error(f"Error processing PDF {pdf_document.id}: {e}")
+        # Duplicates of processed content are marked ready by the worker, not here
+        start_processing(pdf_document)
         
-        # Return the detailed document info
+        # Return the detailed document info; clients poll the status action for progress.
+        # The response is the same for reused content, so it does not reveal other users' uploads
         response_serializer = DocumentDetailSerializer(pdf_document, context={'request': request})
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(response_serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List the user's documents newest first, one cursor page at a time.
+        The first page is what clients poll, so with a shared cache it is cached
+        per user until an upload, edit, delete or status change invalidates it.
+        """
+        if not settings.DOCUMENT_LIST_CACHE or request.query_params.get(self.paginator.cursor_query_param):
+            return super().list(request, *args, **kwargs)
+        
+        cache_key = library_cache.get_cache_key(request.user.pk, request.build_absolute_uri())
+        data = cache.get(cache_key)
+        if data is None:
+            data = super().list(request, *args, **kwargs).data
+            cache.set(cache_key, data, settings.DOCUMENT_LIST_CACHE_TIMEOUT)
+        return Response(data)
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        library_cache.invalidate(serializer.instance.user_id)
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        library_cache.invalidate(instance.user_id)
     
     def retrieve(self, request, *args, **kwargs):
-        """Get detailed document info including thumbnails"""
+        """Get detailed document info including thumbnails; ?fields= selects fields"""
         instance = self.get_object()
-        serializer = self.get_serializer(instance)
-        return Response(serializer.data)
+        return self._conditional_response(request, instance, lambda: self.get_serializer(instance).data)
+    
+    def _conditional_response(self, request, pdf_document, get_data):
+        """
+        Answer with 304 when the client's copy is current, so polling an unchanged
+        document skips serialization. Any change to the document moves updated_at.
+        """
+        validator = f"{pdf_document.pk}:{pdf_document.updated_at.isoformat()}:{request.get_full_path()}"
+        etag = f'"{hashlib.md5(validator.encode()).hexdigest()}"'
+        last_modified = int(pdf_document.updated_at.timestamp())
+        
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = Response(get_data())
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
     
     @action(detail=True, methods=['patch'])
     def update_page_selection(self, request, pk=None):
-        """Update which pages are deleted"""
+        """
+        Update which pages are deleted: replace the whole list with pages_deleted,
+        or change it with delete/restore page ranges such as "10-250,3".
+        Changes are applied under a row lock, so rapid successive updates are not lost.
+        """
         pdf_document = self.get_object()
-        serializer = PageSelectionSerializer(data=request.data)
+        serializer = PageSelectionSerializer(data=request.data, context={'total_pages': pdf_document.total_pages})
         
-        if serializer.is_valid():
-            pages_deleted = serializer.validated_data['pages_deleted']
-            
-            # Validate page numbers are within range
-            if pages_deleted:
-                max_page = max(pages_deleted)
-                if max_page > pdf_document.total_pages:
-                    return Response(
-                        {'error': f'Page {max_page} does not exist. Document has {pdf_document.total_pages} pages.'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-            
-            pdf_document.pages_deleted = pages_deleted
-            pdf_document.save()
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        with transaction.atomic():
+            pdf_document = PDFDocument.objects.select_for_update().get(pk=pdf_document.pk)
+            pages_deleted = serializer.apply(pdf_document.deleted_page_set)
             
-            response_serializer = DocumentDetailSerializer(pdf_document, context={'request': request})
-            return Response(response_serializer.data)
+            if pages_deleted != pdf_document.deleted_page_set:
+                pdf_document.pages_deleted = list(pages_deleted)
+                pdf_document.save(update_fields=['pages_deleted', 'updated_at'])
+                library_cache.invalidate(pdf_document.user_id)
+                
+                # Keep already extracted text in step with the selection; no PDF I/O involved
+                processed_doc = ProcessedDocument.objects.filter(pdf=pdf_document).first()
+                if processed_doc:
+                    processed_doc.refresh_extracted_text()
         
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        response_serializer = DocumentDetailSerializer(pdf_document, context={'request': request})
+        return Response(response_serializer.data)
     
     @action(detail=True, methods=['post'])
     def extract_text(self, request, pk=None):
-        """Extract text from active pages"""
+        """Extract text from active pages; pass ?stream=1 to receive it page by page"""
         pdf_document = self.get_object()
         
-        try:
-            # Extract text excluding deleted pages
-            extracted_text = extract_pdf_text(
-                pdf_document.original_file.path,
-                excluded_pages=pdf_document.pages_deleted or []
+        if request.query_params.get('stream'):
+            response = StreamingHttpResponse(
+                self._stream_extracted_text(pdf_document),
+                content_type='text/plain; charset=utf-8'
             )
+            response['X-Accel-Buffering'] = 'no'  # Let nginx pass pages through as they come
+            return response
+        
+        try:
+            # Documents uploaded before ingestion existed, or interrupted mid-way, are not fully stored yet
+            if not pdf_document.ingested:
+                ingest_document(pdf_document)
+            
+            # Assemble text from the pages stored at ingestion, excluding deleted pages
+            extracted_text = pdf_document.get_active_text()
             
             # Create or update processed document
             processed_doc, created = ProcessedDocument.objects.get_or_create(
@@ -130,7 +196,7 @@ class PDFDocumentViewSet(viewsets.ModelViewSet):
             
             if not created:
                 processed_doc.extracted_text = extracted_text
-                processed_doc.save()
+                processed_doc.save(update_fields=['extracted_text'])
             
             serializer = ProcessedDocumentSerializer(processed_doc, context={'request': request})
             return Response(serializer.data)
@@ -142,22 +208,155 @@ class PDFDocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    def _stream_extracted_text(self, pdf_document):
+        """Yield formatted page text as it becomes available, then store the result"""
+        if pdf_document.ingested:
+            page_texts = pdf_document.iter_active_text()
+        else:
+            # Not ingested yet: parse now and send each page as soon as it is parsed
+            excluded_pages = pdf_document.deleted_page_set
+            page_texts = (
+                (page_num, text) for page_num, text in iter_ingest_document(pdf_document)
+                if page_num not in excluded_pages
+            )
+        
+        for page_num, text in page_texts:
+            if text.strip():
+                yield format_page_text(page_num, text)
+        
+        ProcessedDocument.objects.update_or_create(
+            pdf=pdf_document,
+            defaults={'extracted_text': pdf_document.get_active_text()}
+        )
+    
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """Get processing status of a document"""
         pdf_document = self.get_object()
-        return Response({
+        return self._conditional_response(request, pdf_document, lambda: {
             'status': pdf_document.processing_status,
             'thumbnails_generated': pdf_document.thumbnails_generated,
-            'total_pages': pdf_document.total_pages
+            'total_pages': pdf_document.total_pages,
+            'pages_done': pdf_document.thumbnails_done,
+            'pages_target': pdf_document.thumbnail_target,
+            'progress': pdf_document.thumbnail_progress
         })
+    
+    @action(detail=True, methods=['get'], url_path='thumbnails')
+    def thumbnails(self, request, pk=None):
+        """Page through thumbnail entries with ?offset= and ?limit="""
+        pdf_document = self.get_object()
+        paginator = ThumbnailPagination()
+        page_numbers = paginator.paginate_queryset(range(1, pdf_document.total_pages + 1), request, view=self)
+        return paginator.get_paginated_response(get_thumbnail_entries(pdf_document, request, page_numbers))
+
+    @action(
+        detail=True, methods=['get'], url_path=r'thumbnails/(?P<page_number>[0-9]+)',
+        content_negotiation_class=MediaContentNegotiation
+    )
+    def thumbnail(self, request, pk=None, page_number=None):
+        """
+        Serve one page thumbnail, rendering it on first request.
+        ?size= picks a THUMBNAIL_TIERS size; the format follows the Accept header.
+        """
+        pdf_document = self.get_object()
+        page_number = int(page_number)
+        
+        if not 1 <= page_number <= pdf_document.total_pages:
+            return Response(
+                {'error': f'Page {page_number} does not exist. Document has {pdf_document.total_pages} pages.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        tier = request.query_params.get('size', settings.THUMBNAIL_DEFAULT_TIER)
+        if tier not in settings.THUMBNAIL_TIERS:
+            return Response(
+                {'error': f'Unknown size {tier}. Choose one of {", ".join(settings.THUMBNAIL_TIERS)}.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        image_format = negotiate_image_format(request.META.get('HTTP_ACCEPT'))
+        thumb_path = get_thumbnail(pdf_document.thumbnail_key, page_number, tier, image_format)
+        if thumb_path is None:
+            generate_pdf_thumbnails(
+                pdf_document.original_file.path,
+                pdf_document.thumbnail_key,
+                first_page=page_number,
+                last_page=page_number,
+                page_sizes=pdf_document.get_page_sizes(page_number, page_number) or None
+            )
+            thumb_path = get_thumbnail(pdf_document.thumbnail_key, page_number, tier, image_format)
+            if thumb_path is None:
+                return Response(
+                    {'error': f'Failed to render page {page_number}'},
+                    status=status.HTTP_500_INTERNAL_SERVER_ERROR
+                )
+        
+        # Optionally render the next pages in the background
+        try:
+            prefetch = min(int(request.query_params.get('prefetch', 0)), settings.THUMBNAIL_PREFETCH_MAX)
+        except ValueError:
+            prefetch = 0
+        last_prefetch = min(page_number + prefetch, pdf_document.total_pages)
+        if any(not thumbnail_exists(pdf_document.thumbnail_key, page)
+               for page in range(page_number + 1, last_prefetch + 1)):
+            schedule_prefetch(pdf_document, page_number + 1, last_prefetch)
+        
+        response = serve_file(request, thumb_path, IMAGE_FORMATS[image_format][1])
+        response['Cache-Control'] = 'private, max-age=86400'
+        response['Vary'] = 'Accept'
+        return response
+    
+    @action(
+        detail=True, methods=['get'], url_path=r'sprites/(?P<sheet>[0-9]+)',
+        content_negotiation_class=MediaContentNegotiation
+    )
+    def sprite(self, request, pk=None, sheet=None):
+        """
+        Serve one sprite sheet of page thumbnails. A sheet that is not built yet
+        is queued for the worker and answered with 202 and Retry-After.
+        """
+        pdf_document = self.get_object()
+        sheet = int(sheet)
+        sheet_count = math.ceil(pdf_document.total_pages / settings.THUMBNAIL_SPRITE_PAGES)
+        
+        if not 1 <= sheet <= sheet_count:
+            return Response(
+                {'error': f'Sprite sheet {sheet} does not exist. Document has {sheet_count} sheets.'},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        image_format = negotiate_image_format(request.META.get('HTTP_ACCEPT'))
+        sprite_path = get_sprite_path(pdf_document.thumbnail_key, sheet, image_format)
+        if not os.path.exists(sprite_path):
+            # Clients poll until the sheet exists; queue one build per sheet at a time
+            if cache.add(f'sprite-build:{sprite_path}', True, settings.THUMBNAIL_SPRITE_RETRY_AFTER * 10):
+                schedule_sprite(pdf_document, sheet, image_format)
+            response = Response({'status': 'building', 'sheet': sheet}, status=status.HTTP_202_ACCEPTED)
+            response['Retry-After'] = str(settings.THUMBNAIL_SPRITE_RETRY_AFTER)
+            response['Vary'] = 'Accept'
+            return response
+        
+        response = serve_file(request, sprite_path, IMAGE_FORMATS[image_format][1])
+        response['Cache-Control'] = 'private, max-age=86400'
+        response['Vary'] = 'Accept'
+        return response
 
 class ProcessedDocumentViewSet(viewsets.ModelViewSet):
     serializer_class = ProcessedDocumentSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return ProcessedDocument.objects.filter(pdf__user=self.request.user)
+        # The serializers nest the PDF document; fetch it in the same query
+        processed_docs = ProcessedDocument.objects.filter(pdf__user=self.request.user).select_related('pdf')
+        if self.action == 'list':
+            processed_docs = processed_docs.defer('extracted_text', 'edited_text')
+        return processed_docs
+    
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return ProcessedDocumentListSerializer
+        return ProcessedDocumentSerializer
     
     @action(detail=True, methods=['patch'])
     def update_text(self, request, pk=None):
@@ -185,47 +384,280 @@ class ProcessedDocumentViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
+        if processed_doc.audio_status in ['queued', 'processing']:
+            return Response(
+                {'error': 'Audio generation is already queued or in progress'},
+                status=status.HTTP_409_CONFLICT
+            )
+        
+        processed_doc.audio_status = 'queued'
+        processed_doc.audio_progress = 0
+        processed_doc.audio_attempts = 0
+        processed_doc.save(update_fields=['audio_status', 'audio_progress', 'audio_attempts', 'updated_at'])
+        
+        # Synthesis runs in the worker; clients poll audio_status for progress
+        transaction.on_commit(lambda: schedule_audio(processed_doc, text_to_convert))
+        logger.info(f"Queued audio generation for processed document {processed_doc.id}")
+        
+        serializer = self.get_serializer(processed_doc)
+        return Response(serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def audio_status(self, request, pk=None):
+        """Get audio generation status of a processed document"""
+        processed_doc = self.get_object()
+        return Response({
+            'status': processed_doc.audio_status,
+            'progress': processed_doc.audio_progress,
+            'audio_file': request.build_absolute_uri(processed_doc.audio_file.url) if processed_doc.audio_file else None
+        })
+
+    @action(
+        detail=True, methods=['get'], url_path='playlist.m3u8',
+        content_negotiation_class=MediaContentNegotiation
+    )
+    def playlist(self, request, pk=None):
+        """
+        HLS playlist of the audio segments finished so far, so playback can
+        start long before synthesis completes. Players re-poll it until it ends
+        with #EXT-X-ENDLIST.
+        """
+        processed_doc = self.get_object()
+        
+        # Only the unbroken run of finished segments from the start is playable
+        playable = []
+        for segment in processed_doc.segments.only('document', 'index', 'cache_key', 'duration', 'completed'):
+            if not segment.completed:
+                break
+            playable.append(segment)
+        
+        finished = processed_doc.audio_status == 'completed'
+        if not playable and not finished:
+            return Response(
+                {'error': 'No audio is available yet', 'status': processed_doc.audio_status},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        target_duration = math.ceil(max((segment.duration for segment in playable), default=1))
+        lines = [
+            '#EXTM3U',
+            '#EXT-X-VERSION:3',
+            f'#EXT-X-TARGETDURATION:{target_duration}',
+            '#EXT-X-MEDIA-SEQUENCE:0',
+            '#EXT-X-PLAYLIST-TYPE:EVENT',
+        ]
+        for segment in playable:
+            lines.append(f'#EXTINF:{segment.duration:.3f},')
+            lines.append(request.build_absolute_uri(
+                reverse('processeddocument-segment', kwargs={
+                    'pk': processed_doc.pk, 'index': segment.index, 'cache_key': segment.cache_key
+                })
+            ))
+        if finished:
+            lines.append('#EXT-X-ENDLIST')
+        
+        response = HttpResponse('\n'.join(lines) + '\n', content_type='application/vnd.apple.mpegurl')
+        response['Cache-Control'] = 'private, max-age=3600' if finished else 'no-cache'
+        return response
+    
+    @action(
+        detail=True, methods=['get'], url_path=r'segments/(?P<index>[0-9]+)-(?P<cache_key>[0-9a-f]{64})\.mp3',
+        content_negotiation_class=MediaContentNegotiation
+    )
+    def segment(self, request, pk=None, index=None, cache_key=None):
+        """
+        Serve one finished audio segment, with Range support for seeking.
+        The URL names the segment's content, so it can be cached for good; after
+        the text changes and audio is regenerated, the playlist lists new URLs.
+        """
+        processed_doc = self.get_object()
+        segment = processed_doc.segments.filter(index=int(index), cache_key=cache_key, completed=True).first()
+        
+        segment_path = AudioSegmentCache().path(segment.cache_key) if segment else None
+        if not segment_path or not os.path.exists(segment_path):
+            return Response({'error': 'Segment not available'}, status=status.HTTP_404_NOT_FOUND)
+        
+        response = serve_file(request, segment_path, 'audio/mpeg')
+        response['Cache-Control'] = 'private, max-age=31536000, immutable'
+        return response
+
+class UploadSessionViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.DestroyModelMixin,
+                           viewsets.GenericViewSet):
+    """
+    Resumable uploads. POST {filename, length} opens a session; PATCH appends
+    the raw request body at the offset given in the Upload-Offset header; GET or
+    HEAD reports the current offset after a dropped connection; POST finalize/
+    turns the completed file into a document.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.request.user)
+    
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+    
+    def finalize_response(self, request, response, *args, **kwargs):
+        # Let clients resume without parsing the body
+        session = getattr(self, 'session', None)
+        if session is not None:
+            response['Upload-Offset'] = str(session.offset)
+            response['Upload-Length'] = str(session.length)
+        return super().finalize_response(request, response, *args, **kwargs)
+    
+    def get_object(self):
+        self.session = super().get_object()
+        return self.session
+    
+    def partial_update(self, request, *args, **kwargs):
+        """
+        Append one chunk of the file. The body is written without a transaction
+        open; the offset then only advances if no other request moved it meanwhile.
+        """
         try:
-            # Generate unique filename
-            import time
-            audio_filename = f"audio_{processed_doc.pdf.id}_{int(time.time())}.mp3"
-            audio_path = os.path.join(settings.MEDIA_ROOT, 'audio', audio_filename)
-            
-            # Ensure audio directory exists
-            os.makedirs(os.path.dirname(audio_path), exist_ok=True)
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            return Response({'error': 'An integer Upload-Offset header is required'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        session = self.get_object()
+        if session.status != 'uploading':
+            return Response({'error': 'Upload is already finalized'}, status=status.HTTP_409_CONFLICT)
+        try:
+            # One chunk at a time per session
+            with lock_session(session):
+                session.refresh_from_db(fields=['offset', 'status'])
+                if session.status != 'uploading':
+                    return Response({'error': 'Upload is already finalized'}, status=status.HTTP_409_CONFLICT)
+                if offset != session.offset:
+                    return Response(
+                        {'error': f'Upload-Offset must be {session.offset}', 'offset': session.offset},
+                        status=status.HTTP_409_CONFLICT
+                    )
+                
+                append_to_session(session, request.read)
+                advanced = UploadSession.objects.filter(pk=session.pk, offset=offset, status='uploading').update(
+                    offset=session.offset, updated_at=timezone.now()
+                )
+        except UploadInProgress as e:
+            return Response({'error': str(e), 'offset': session.offset}, status=status.HTTP_409_CONFLICT)
+        except UploadError as e:
+            return Response({'error': str(e), 'offset': session.offset}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if not advanced:
+            # Finalized or deleted while the chunk streamed in
+            discard_session_hasher(session)
+            return Response({'error': 'Upload changed while the chunk was received'}, status=status.HTTP_409_CONFLICT)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    
+    @action(detail=True, methods=['post'])
+    def finalize(self, request, pk=None):
+        """Turn a fully received upload into a document and start processing it"""
+        with transaction.atomic():
+            session = self.get_object()
+            self.session = session = UploadSession.objects.select_for_update().get(pk=session.pk)
             
-            # Start background task (if you have Celery set up)
-            # generate_audio_task.delay(text_to_convert, audio_path)
+            if session.status != 'uploading':
+                return Response({'error': 'Upload is already finalized'}, status=status.HTTP_409_CONFLICT)
+            if session.offset != session.length:
+                return Response(
+                    {'error': f'Upload is incomplete: {session.offset} of {session.length} bytes received'},
+                    status=status.HTTP_409_CONFLICT
+                )
             
-            # For now, we'll just update status
-            processed_doc.audio_status = 'processing'
-            processed_doc.save()
+            try:
+                triage = triage_pdf(session.path)
+            except PDFTriageError as e:
+                # Nothing the client can resume; drop the session
+                self.perform_destroy(session)
+                self.session = None
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            serializer = self.get_serializer(processed_doc)
-            return Response(serializer.data)
+            # The hash was computed as the chunks arrived; the file is moved, not read again
+            content_hash = get_session_hasher(session).hexdigest()
+            upload = SessionUpload(session)
+            try:
+                pdf_document = PDFDocument.create_from_upload(
+                    request.user, upload, content_hash, session.filename, triage=triage
+                )
+            finally:
+                upload.close()
             
-        except Exception as e:
-            logger.error(f"Error generating audio for document {processed_doc.id}: {e}")
-            return Response(
-                {'error': 'Failed to generate audio'},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR
-            )
+            session.status = 'completed'
+            session.document = pdf_document
+            session.save(update_fields=['status', 'document', 'updated_at'])
+            library_cache.invalidate(request.user.pk)
+            start_processing(pdf_document)
+        
+        # Duplicate content leaves the part file behind
+        if os.path.exists(session.path):
+            os.remove(session.path)
+        discard_session_hasher(session)
+        
+        response_serializer = DocumentDetailSerializer(pdf_document, context={'request': request})
+        return Response(response_serializer.data, status=status.HTTP_202_ACCEPTED)
+    
+    def perform_destroy(self, instance):
+        if os.path.exists(instance.path):
+            os.remove(instance.path)
+        discard_session_hasher(instance)
+        super().perform_destroy(instance)
+
+def user_owns_media(user, name):
+    """
+    Check that a media file (path relative to MEDIA_ROOT) belongs to one of the
+    user's documents. Unknown locations are never served.
+    """
+    parts = name.split('/')
+    if parts[0] in ('pdfs', 'blobs'):
+        return PDFDocument.objects.filter(user=user, original_file=name).exists()
+    if parts[0] == 'thumbnails' and len(parts) == 3:
+        thumbnail_key = parts[1]
+        documents = PDFDocument.objects.filter(user=user)
+        try:
+            # Uploads that predate deduplication keep thumbnails under their own ID
+            return documents.filter(id=uuid.UUID(thumbnail_key), blob__isnull=True).exists()
+        except ValueError:
+            return documents.filter(blob_id=thumbnail_key).exists()
+    if parts[0] == 'audio':
+        return ProcessedDocument.objects.filter(pdf__user=user, audio_file=name).exists()
+    if parts[0] == 'audio_cache' and len(parts) == 3:
+        cache_key = posixpath.splitext(parts[2])[0]
+        return AudioSegment.objects.filter(document__pdf__user=user, cache_key=cache_key).exists()
+    return False
+
+@api_view(['GET', 'HEAD'])
+@permission_classes([IsAuthenticated])
+def serve_media(request, path):
+    """Serve an uploaded PDF, thumbnail or audio file to its owner"""
+    name = posixpath.normpath(path).lstrip('/')
+    if name.startswith('..') or not user_owns_media(request.user, name):
+        raise Http404("File not found")
+    
+    file_path = os.path.join(settings.MEDIA_ROOT, *name.split('/'))
+    if not os.path.isfile(file_path):
+        raise Http404("File not found")
+    
+    content_type = mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
+    response = serve_file(request, file_path, content_type)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
 
 # Legacy function-based views for backward compatibility
 @login_required
 def upload_pdf(request):
     """Legacy view - redirect to use API instead"""
-    return JsonResponse({'message': 'Use POST /api/converter/documents/ instead'}, status=410)
+    return JsonResponse({'message': 'Use POST /api/documents/ instead'}, status=410)
 
 @login_required
 def select_pages(request, file_id):
     """Legacy view - redirect to use API instead"""
-    return JsonResponse({'message': f'Use GET /api/converter/documents/{file_id}/ instead'}, status=410)
+    return JsonResponse({'message': f'Use GET /api/documents/{file_id}/ instead'}, status=410)
 
 @login_required
 def edit_text(request, file_id):
     """Legacy view - redirect to use API instead"""
-    return JsonResponse({'message': f'Use POST /api/converter/documents/{file_id}/extract_text/ instead'}, status=410)
+    return JsonResponse({'message': f'Use POST /api/documents/{file_id}/extract_text/ instead'}, status=410)
 
 @login_required
 def generate_audio(request, file_id):
@@ -235,4 +667,4 @@ def generate_audio(request, file_id):
 @login_required
 def play_audio(request, audio_id):
     """Legacy view - redirect to use API instead"""
-    return JsonResponse({'message': 'Use ProcessedDocument API instead'}, status=410)
\ No newline at end of file
+    return JsonResponse({'message': 'Use GET /api/processed/<id>/playlist.m3u8 instead'}, status=410)
\ No newline at end of file
@@ -0,0 +1,17 @@
+"""
+Celery application for pdf2audio_core project.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "pdf2audio_core.settings")
+
+app = Celery("pdf2audio_core")
+
+# Read CELERY_* settings from Django settings
+app.config_from_object("django.conf:settings", namespace="CELERY")
+
+# Load tasks.py from all installed apps
+app.autodiscover_tasks()
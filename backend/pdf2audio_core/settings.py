@@ -4,6 +4,7 @@ Django settings for pdf2audio_core project.
 
 from pathlib import Path
 import os
+import tempfile
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -72,6 +73,18 @@ DATABASES = {
     }
 }
 
+# Cache
+# Web and Celery processes must share it for list-cache invalidation to reach every
+# process; without CACHE_URL each process has its own and the document list is not cached
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_URL'],
+    } if os.environ.get('CACHE_URL') else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -101,6 +114,78 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 # Media files
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Let the web server send media bodies after Django checks ownership:
+# '' (Django streams via wsgi.file_wrapper), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache)
+MEDIA_SENDFILE_BACKEND = os.environ.get('MEDIA_SENDFILE_BACKEND', '')
+MEDIA_SENDFILE_URL = '/protected-media/'  # nginx `internal` location aliased to MEDIA_ROOT
+
+# Hash uploads while they stream in so duplicate PDFs can be detected without re-reading them
+FILE_UPLOAD_HANDLERS = [
+    'converter.uploads.HashingMemoryFileUploadHandler',
+    'converter.uploads.HashingTemporaryFileUploadHandler',
+]
+
+# Resumable uploads: chunks are appended to a part file, then moved into blob storage
+UPLOAD_SESSION_DIR = os.path.join(MEDIA_ROOT, 'upload_sessions')  # Same filesystem as blobs, so finalize is a rename
+UPLOAD_MAX_BYTES = 1024 ** 3  # Largest declared upload length accepted
+UPLOAD_SESSION_EXPIRY = 24 * 60 * 60  # Seconds without a chunk before an unfinished upload is deleted
+
+TRIAGE_SAMPLE_PAGES = 5  # Pages inspected at upload to estimate how much of a PDF has a text layer
+
+# Thumbnail rendering
+# Every page is rendered once and saved at each tier size, in each format (plus JPEG);
+# clients pick a tier with ?size= and get the best format their Accept header allows
+THUMBNAIL_TIERS = {
+    'small': (100, 140),
+    'medium': (200, 280),
+    'large': (600, 840),
+}
+THUMBNAIL_DEFAULT_TIER = 'medium'  # Used for sprite sheets; its JPEG copy is page_N.jpg
+THUMBNAIL_FORMATS = ['WEBP', 'JPEG']  # In order of preference; add 'AVIF' where Pillow supports it
+THUMBNAIL_CHUNK_SIZE = 10  # Pages handed to poppler per render call
+THUMBNAIL_RENDER_WORKERS = 4  # Page ranges of one document rendered in parallel
+# Machine-wide cap on concurrent poppler renders, shared by all uploads and processes
+THUMBNAIL_RENDER_MAX_PROCESSES = int(os.environ.get('THUMBNAIL_RENDER_MAX_PROCESSES', os.cpu_count() or 1))
+THUMBNAIL_RENDER_LOCK_DIR = os.path.join(tempfile.gettempdir(), 'pdf2audio-render-slots')
+THUMBNAIL_EAGER_PAGES = 24  # First screen rendered at upload; later pages render on request
+THUMBNAIL_PREFETCH_MAX = 48  # Upper bound on ?prefetch= for the thumbnail endpoint
+THUMBNAIL_LIST_LIMIT = 100  # Thumbnail entries per page of the detail/thumbnail listings
+THUMBNAIL_LIST_MAX_LIMIT = 1000  # Upper bound on ?limit= for the thumbnail listing
+THUMBNAIL_SPRITE_PAGES = 50  # Pages per sprite sheet served to the page grid
+THUMBNAIL_SPRITE_COLUMNS = 10  # Tiles per sprite sheet row
+THUMBNAIL_SPRITE_RETRY_AFTER = 2  # Seconds clients wait before asking again for a sheet being built
+
+# Job scheduling (converter.scheduler)
+SCHEDULER_BROKER = os.environ.get('SCHEDULER_BROKER', 'converter.scheduler.CeleryBroker')  # or InProcessBroker
+SCHEDULER_INGEST_PAGE_COST = 0.05  # Cost of ingesting one page, relative to rendering one thumbnail
+SCHEDULER_SCANNED_PAGE_COST = 3  # Cost of rendering one image-only page (see triage text_layer), same units
+SCHEDULER_OCR_PAGE_COST = 5  # Cost of OCRing one page, relative to rendering one thumbnail
+
+# OCR for pages without a text layer (needs pytesseract and the tesseract binary)
+OCR_ENABLED = os.environ.get('OCR_ENABLED', '1') == '1'
+OCR_LANGUAGE = 'eng'  # Tesseract language codes, e.g. 'eng+deu'
+OCR_DPI = 300  # Resolution pages are rendered at for OCR; thumbnail tiers are far too small to read
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))  # Concurrent tesseract processes per worker
+
+# Pipeline recovery: jobs record progress as they go and resume where they stopped
+PIPELINE_STALL_TIMEOUT = 30 * 60  # Seconds without progress before the sweeper requeues a job
+PIPELINE_SWEEP_INTERVAL = 5 * 60  # Seconds between sweeps for stalled jobs
+PIPELINE_MAX_ATTEMPTS = 3  # Runs of a document's or audio's job before it is marked error/failed
+
+# Document library listing
+DOCUMENT_LIST_PAGE_SIZE = 50  # Documents per cursor page
+# Cache the first page only with a shared cache; a per-process one never sees the worker's invalidations
+DOCUMENT_LIST_CACHE = bool(os.environ.get('CACHE_URL'))
+DOCUMENT_LIST_CACHE_TIMEOUT = 300  # Seconds a cached first page lives if nothing invalidates it
+
+# Text-to-speech
+TTS_ENGINE = os.environ.get('TTS_ENGINE', 'converter.tts.GTTSEngine')  # 'converter.tts.StubTTSEngine' works offline
+TTS_LANGUAGE = 'en'
+TTS_CHUNK_MAX_CHARS = 1500  # Text per synthesis request, split on paragraph/sentence boundaries
+TTS_MAX_WORKERS = 4  # Chunks synthesized concurrently per document
+TTS_CHUNK_RETRIES = 3  # Retries for a failed chunk before the whole job fails
+TTS_CACHE_DIR = os.path.join(MEDIA_ROOT, 'audio_cache')  # Synthesized segments keyed by text hash
+TTS_CACHE_MAX_BYTES = 2 * 1024 ** 3  # Least recently used segments no playlist lists are evicted above this
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
@@ -137,6 +222,44 @@ CORS_ALLOW_METHODS = [
     'PUT',
 ]
 
+# Celery configuration
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL)
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+# Jobs are published by converter.scheduler to one queue per stage, with priorities;
+# Redis emulates priorities with one list per level, 0 being the most urgent
+CELERY_TASK_ROUTES = {
+    'converter.tasks.generate_thumbnails_task': {'queue': 'thumbnails'},
+    'converter.tasks.prefetch_thumbnails_task': {'queue': 'prefetch'},
+    'converter.tasks.sprite_sheet_task': {'queue': 'prefetch'},
+    'converter.tasks.generate_audio_task': {'queue': 'audio'},
+    'converter.tasks.ocr_document_task': {'queue': 'ocr'},
+    'converter.tasks.resume_stalled_jobs': {'queue': 'thumbnails'},
+    'converter.tasks.expire_upload_sessions': {'queue': 'thumbnails'},
+}
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'queue_order_strategy': 'priority',
+    'priority_steps': list(range(10)),
+    'visibility_timeout': 4 * 60 * 60,  # Unacknowledged jobs are redelivered after this; keep it above the longest job
+}
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1  # Reserved messages would bypass the priority order
+# Acknowledge jobs when they finish, so one whose worker dies is redelivered and resumes
+CELERY_TASK_ACKS_LATE = True
+CELERY_TASK_REJECT_ON_WORKER_LOST = True
+CELERY_BEAT_SCHEDULE = {
+    'resume-stalled-jobs': {
+        'task': 'converter.tasks.resume_stalled_jobs',
+        'schedule': PIPELINE_SWEEP_INTERVAL,
+    },
+    'expire-upload-sessions': {
+        'task': 'converter.tasks.expire_upload_sessions',
+        'schedule': 60 * 60,
+    },
+}
+# Run tasks inline when no broker is available (local development)
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '0') == '1'
+
 # Custom user model (if you have one)
 # AUTH_USER_MODEL = 'account.CustomUser'
 